@@ -0,0 +1,260 @@
+"""
+Microbenchmarks for the hot paths of download_notifier.py.
+
+Run from the project folder, e.g.:
+    python benchmarks.py classifier
+    python benchmarks.py startup [--exe dist/download_notifier]
+    python benchmarks.py stat-sweep [--files 8 1000 10000] [--other-files 20000] [--latency-ms 0.2]
+"""
+import argparse
+import os
+import contextlib
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import download_notifier
+
+
+# --- File Classification ---
+def _legacy_is_file_temporary(file_path):
+    """The per-suffix loop _is_file_temporary used before FileClassifier."""
+    file_name = os.path.basename(file_path)
+    file_name_lower = file_name.lower()
+    for ext in download_notifier.TEMP_FILE_EXTENSIONS:
+        if file_name_lower.endswith(ext):
+            return True
+    if (file_name_lower.startswith("downloading_") or
+        file_name_lower.startswith("temp_") or
+        "_downloading" in file_name_lower or
+        file_name.startswith(".")):
+        return True
+    return False
+
+def _legacy_is_likely_telegram_file(file_path):
+    """The substring checks _is_likely_telegram_file used before FileClassifier."""
+    path_lower = file_path.lower()
+    if "telegram desktop" in path_lower or "tdata" in path_lower:
+        return True
+    file_name = os.path.basename(file_path)
+    return len(file_name) >= 10 and "." not in file_name and file_name.isalnum()
+
+def _sample_event_paths(count):
+    """A mix of final, temporary and Telegram-looking paths like a busy Downloads folder produces."""
+    home = os.path.expanduser("~")
+    names = [
+        "ubuntu-24.04-desktop-amd64.iso", "report final (2).pdf", "IMG_20240101_101010.jpg",
+        "setup.exe.crdownload", "video.mp4.part", "archive.zip.tmp", ".~lock.notes.odt#",
+        "temp_upload.bin", "song_downloading.mp3", "5f2b9c7e1d4a8b3c", "photo_2024-01-01.jpg",
+    ]
+    folders = [
+        os.path.join(home, "Downloads"),
+        os.path.join(home, "Downloads", "Telegram Desktop"),
+        os.path.join(home, "Downloads", "projects", "build", "artifacts"),
+    ]
+    rng = random.Random(0)
+    return [os.path.join(rng.choice(folders), rng.choice(names)) for _ in range(count)]
+
+def bench_classifier(args):
+    paths = _sample_event_paths(args.events)
+    classifier = download_notifier.FileClassifier()
+
+    def legacy(path):
+        # The enrichment stage asked both questions for every non-temporary file
+        return _legacy_is_file_temporary(path) or _legacy_is_likely_telegram_file(path)
+
+    for label, func in (("legacy helpers", legacy), ("FileClassifier", classifier.classify)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for path in paths:
+                func(path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{label:>16}: {len(paths) / best:>12,.0f} events/s ({best * 1e9 / len(paths):.0f} ns/event)")
+
+
+# --- Start-up Time ---
+def _parse_importtime(stderr):
+    """Returns {module: cumulative microseconds} for top-level imports in -X importtime output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented further in the name column
+        if cumulative_us.strip().isdigit() and not name[1:].startswith(" "):
+            cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+def _time_command(command, runs, env=None):
+    """Runs command `runs` times; returns (median wall seconds, stderr of the last run)."""
+    timings = []
+    stderr = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True, env=env)
+        timings.append(time.perf_counter() - start)
+        stderr = completed.stderr
+    return statistics.median(timings), stderr
+
+def _report_startup(label, wall, stderr, top):
+    print(f"{label}: {wall * 1000:.0f} ms wall (median)")
+    imports = _parse_importtime(stderr)
+    if not imports:
+        return
+    print(f"  imports: {sum(imports.values()) / 1000:.0f} ms; slowest top-level modules:")
+    for name, micros in sorted(imports.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {micros / 1000:8.1f} ms  {name}")
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    scenarios = (
+        ("headless (python -X importtime)", "import download_notifier"),
+        ("GUI (python -X importtime)", "import download_notifier; download_notifier._load_gui_modules()"),
+    )
+    for label, code in scenarios:
+        wall, stderr = _time_command([sys.executable, "-X", "importtime", "-c", code], args.runs,
+                                     env=dict(os.environ, PYTHONPATH=here))
+        _report_startup(label, wall, stderr, args.top)
+
+    if args.exe:
+        # "--help" exits right after the module-level imports and argument parsing.
+        # Build with DOWNLOAD_NOTIFIER_IMPORTTIME=1 (see download_notifier.spec) to get the
+        # per-module breakdown of the frozen app as well.
+        wall, stderr = _time_command([args.exe, "--help"], args.runs)
+        _report_startup(f"PyInstaller build ({args.exe} --help)", wall, stderr, args.top)
+
+
+# --- Stat Sweeps ---
+class _SlowDirEntry:
+    """DirEntry whose stat() costs a round trip, as on NFS and other POSIX network mounts."""
+    def __init__(self, entry, latency):
+        self._entry = entry
+        self._latency = latency
+        self.name = entry.name
+        self.path = entry.path
+
+    def stat(self, *, follow_symlinks=True):
+        time.sleep(self._latency)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+class _SlowListing:
+    """os.scandir stand-in: one round trip per 1024 entries, like a paged network directory listing."""
+    def __init__(self, directory, latency, attributes_in_listing, real_scandir):
+        self._entries = list(real_scandir(directory))
+        time.sleep(latency * (1 + len(self._entries) // 1024))
+        self._latency = 0 if attributes_in_listing else latency
+
+    def __enter__(self):
+        return iter(_SlowDirEntry(entry, self._latency) if self._latency else entry for entry in self._entries)
+
+    def __exit__(self, *exc_info):
+        return False
+
+@contextlib.contextmanager
+def _slow_file_system(latency, attributes_in_listing):
+    """Adds `latency` seconds to every metadata round trip made through os.stat and os.scandir."""
+    real_stat, real_scandir = os.stat, os.scandir
+
+    def slow_stat(path, *args, **kwargs):
+        time.sleep(latency)
+        return real_stat(path, *args, **kwargs)
+
+    os.stat = slow_stat
+    os.scandir = lambda directory: _SlowListing(directory, latency, attributes_in_listing, real_scandir)
+    try:
+        yield
+    finally:
+        os.stat, os.scandir = real_stat, real_scandir
+
+def _separate_calls(paths):
+    """What a completion check cost before it was reduced to one os.stat."""
+    for path in paths:
+        if os.path.exists(path):
+            os.path.getsize(path)
+            os.path.getmtime(path)
+
+def bench_stat_sweep(args):
+    handler = download_notifier.SizeAwareDownloadHandler(download_notifier.HeadlessNotifier([]))
+
+    def handler_tick(sweep_min_files):
+        def tick(paths):
+            download_notifier.STAT_SWEEP_MIN_FILES = sweep_min_files
+            for _ in handler._stat_due_files(paths):
+                pass
+        return tick
+
+    strategies = (
+        ("exists+getsize+getmtime", _separate_calls),
+        ("os.stat per file", handler_tick(None)),
+        ("scandir sweep", handler_tick(1)),
+    )
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None # tmpfs where available
+    saved_min_files = download_notifier.STAT_SWEEP_MIN_FILES
+    try:
+        for count in args.files:
+            directory = tempfile.mkdtemp(prefix="stat_sweep_", dir=base)
+            try:
+                paths = []
+                for i in range(count):
+                    paths.append(os.path.join(directory, f"download_{i:05d}.bin"))
+                    with open(paths[-1], "wb") as f:
+                        f.write(b"x" * (i % 4096))
+                for i in range(args.other_files):
+                    # Finished downloads and other files; a sweep lists them all, a stat never sees them
+                    open(os.path.join(directory, f"other_{i:06d}.dat"), "wb").close()
+                print(f"{count:,} tracked files among {count + args.other_files:,} entries in {directory}:")
+                for label, tick in strategies:
+                    best = min(_timed(tick, paths) for _ in range(args.repeat))
+                    print(f"  {'local':>12} {label:>24}: {best * 1000:9.1f} ms/tick ({best * 1e6 / count:7.2f} us/file)")
+                latency = args.latency_ms / 1000
+                for fs_label, attributes_in_listing in (("slow, SMB", True), ("slow, NFS", False)):
+                    for label, tick in strategies:
+                        with _slow_file_system(latency, attributes_in_listing):
+                            elapsed = _timed(tick, paths)
+                        print(f"  {fs_label:>12} {label:>24}: {elapsed * 1000:9.1f} ms/tick ({elapsed * 1e6 / count:7.2f} us/file)")
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        download_notifier.STAT_SWEEP_MIN_FILES = saved_min_files
+    print(f"slow: {args.latency_ms} ms per round trip; SMB-like listings carry sizes and times, "
+          "NFS-like ones need a stat per entry")
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subcommands = parser.add_subparsers(dest="benchmark", required=True)
+
+    classifier_parser = subcommands.add_parser("classifier", help="events/s classified by FileClassifier vs. the old helpers")
+    classifier_parser.add_argument("--events", type=int, default=200_000)
+    classifier_parser.add_argument("--repeat", type=int, default=5)
+    classifier_parser.set_defaults(func=bench_classifier)
+
+    startup_parser = subcommands.add_parser("startup", help="cold-start and import time of the GUI, headless and frozen app")
+    startup_parser.add_argument("--exe", help="path to the PyInstaller build (dist/download_notifier[.exe])")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=8, help="number of slowest imports to list")
+    startup_parser.set_defaults(func=bench_startup)
+
+    sweep_parser = subcommands.add_parser("stat-sweep", help="per-file stats vs. one scandir sweep per directory")
+    sweep_parser.add_argument("--files", type=int, nargs="+", default=[8, 1000, 10_000], help="tracked files per run")
+    sweep_parser.add_argument("--other-files", type=int, default=20_000, help="untracked files in the same folder")
+    sweep_parser.add_argument("--repeat", type=int, default=5)
+    sweep_parser.add_argument("--latency-ms", type=float, default=0.2, help="simulated round trip of the slow file system")
+    sweep_parser.set_defaults(func=bench_stat_sweep)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,26 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox
 import os
+import sys
 import time
 import threading
-from watchdog.observers import Observer
+import argparse
+import signal
+import socket
+import heapq
+import itertools
+import queue
+import enum
+import collections
+import concurrent.futures
 from watchdog.events import FileSystemEventHandler
-import pygame # Used for playing alarm sounds
 import json
-import requests
-from urllib.parse import urlparse
 import re
-import sqlite3 # Added for potential Telegram DB access, though highly experimental
+import pathlib
+# Heavier modules (watchdog.observers, sqlite3, requests, tkinter, pygame) are imported on
+# first use so that start-up, and headless mode in particular, only pays for what it runs.
+
+# GUI-only modules, imported by _load_gui_modules() so headless mode never loads Tk or pygame
+tk = filedialog = messagebox = None
+pygame = None # Used for playing alarm sounds
 
 # --- Configuration ---
 # Default download directory (can be changed by user)
@@ -19,6 +29,150 @@ DEFAULT_DOWNLOAD_DIR = os.path.join(os.path.expanduser("~"), "Downloads")
 # Pygame supports both WAV and MP3.
 # Make sure you have an alarm.wav or alarm.mp3 file in the same directory as this script.
 ALARM_SOUND_FILE = "alarm.wav" # You can change this to "alarm.mp3" if you prefer
+# Optional per-file-type alarms, e.g. {".mp4": "video.wav", ".zip": "archive.wav"}.
+# Every sound listed here (and ALARM_SOUND_FILE) is decoded once at start-up.
+ALARM_SOUNDS_BY_EXTENSION = {}
+# Seconds to wait before re-checking a file that is still downloading.
+RECHECK_INTERVAL = 2
+# Seconds to wait before confirming that a file which reached its expected size has settled.
+SIZE_CONFIRM_INTERVAL = 1
+# Number of completion workers. A given file is always checked by the same worker,
+# so one slow disk or network share only stalls the files that hash to its worker.
+COMPLETION_WORKER_COUNT = 4
+# Seconds to hold a new path before tracking it, so that bursts of created/moved/modified
+# events for the same path (e.g. temp renames) are merged into one tracked entry.
+EVENT_COALESCE_WINDOW = 0.5
+# Seconds a file must go without writes after its writer closes it (inotify close-after-write)
+# before it is reported as complete.
+CLOSE_GRACE_PERIOD = 0.5
+# Polling interval for files of unknown size once the platform is known to deliver close
+# events. Polling is only a fallback then, for writers that keep the file open.
+FALLBACK_POLL_INTERVAL = 10
+# A directory with at least this many due files is refreshed from one os.scandir listing
+# instead of one stat per file, or None (the default) for one os.stat per file. Sweeps are off
+# everywhere: a listing costs as much as the folder is large (a few due files in a folder of
+# 50,000 take ~1000x longer than their stats), each completion worker sweeps its own share of
+# a folder, and on Windows, the one platform where listings carry sizes and times, those can lag
+# behind for files still open for writing, so a download in progress could look stable.
+# Only worth setting for a slow share that holds little but downloads that are written and
+# closed; see "python benchmarks.py stat-sweep".
+STAT_SWEEP_MIN_FILES = None
+# Most due files a completion worker takes from its queue at once.
+STAT_SWEEP_BATCH_LIMIT = 256
+# Check the structure of ZIP (and ZIP-based), PDF, PNG and MP4 files from their last bytes,
+# so a whole file completes without waiting for the stability window and a cut-off one is
+# flagged in the log.
+FORMAT_VALIDATION_ENABLED = True
+# Files of known size are re-checked about halfway to their estimated finish time (from a
+# rolling average of their growth rate), never sooner than MIN_CHECK_INTERVAL and never later
+# than MAX_CHECK_INTERVAL seconds. Files that stop growing are checked less and less often.
+MIN_CHECK_INTERVAL = 0.5
+MAX_CHECK_INTERVAL = 60
+# Weight of the newest sample in the rolling growth rate (0-1; higher reacts faster).
+RATE_SMOOTHING = 0.3
+# When monitoring starts, also track files modified in the last this many minutes, so downloads
+# that began before "Start Monitoring" still get a notification. 0 disables the scan.
+INITIAL_SCAN_MINUTES = 0
+# gitignore-style rules for what to watch below each monitored root, applied before a watch is
+# installed and before events reach the handler. "name/" only matches folders, a pattern with
+# a "/" inside is relative to the root, "**" spans folders, and "!pattern" re-includes a path.
+WATCH_IGNORE_PATTERNS = (
+    ".git/", ".hg/", ".svn/", "node_modules/", "__pycache__/", ".venv/", ".tox/", ".cache/",
+)
+# Folder levels below each root to watch (0 = only the root itself), or None for no limit.
+MAX_WATCH_DEPTH = None
+# Most separate watches used to leave out ignored folders. Every watch costs watchdog a thread
+# and (on Linux) an inotify instance, of which only 128 are allowed per user by default;
+# a root that would need more is watched whole and the rules only filter its events.
+MAX_PRUNED_WATCHES = 32
+# Seconds after monitoring starts to log how many inotify watches are in use (Linux only).
+WATCH_REPORT_DELAY = 3
+
+# File name patterns for downloads that are still in progress (matched case-insensitively).
+TEMP_FILE_EXTENSIONS = (
+    ".tmp", ".crdownload", ".part", ".download", ".filepart",
+    ".idm", ".idm.tmp", ".idm.bak", ".dwnl", ".inprogress",
+    ".downloading", ".temp", ".partial", ".resume",
+    ".unconfirmed", ".opdownload", ".!ut", ".td", # .td for Telegram temp
+)
+TEMP_FILE_PREFIXES = ("downloading_", "temp_")
+TEMP_FILE_MARKERS = ("_downloading",) # Anywhere in the file name
+# Path fragments that mark a file as coming from Telegram Desktop.
+TELEGRAM_PATH_MARKERS = ("telegram desktop", "tdata")
+# Glob patterns (matched against the file name) for files that should never be tracked,
+# e.g. ("*.torrent", "desktop.ini").
+IGNORED_FILE_PATTERNS = ()
+
+# Sidecar extensions that may describe the expected size of a download,
+# e.g. "movie.mkv.info" or ".movie.info" next to "movie.mkv".
+COMPANION_FILE_EXTENSIONS = (".info", ".meta", ".json")
+# Expected-size providers are asked in priority order. "sequential" asks one at a time and stops
+# at the first answer; "concurrent" asks all of them at once and takes whichever answers first.
+SIZE_PROVIDER_MODE = "sequential"
+# Seconds a provider may take before its answer is given up on.
+SIZE_PROVIDER_TIMEOUT = 2
+# Threads shared by the providers, so a slow one cannot hold up detection for every file.
+SIZE_PROVIDER_THREADS = 4
+# Providers to switch off, e.g. {"telegram"}. Their timings and hit rates are logged when
+# monitoring stops, to show which ones cost more than they return.
+DISABLED_SIZE_PROVIDERS = set()
+# Seconds a size looked up in the Telegram database (or found missing) stays cached.
+# Every cached answer is dropped as soon as the database file's mtime changes.
+TELEGRAM_DB_CACHE_TTL = 30
+# Download histories of Chrome-family browsers ("History") and Firefox ("places.sqlite"),
+# as glob patterns. They are read from snapshot copies, never opened in place.
+_LOCAL_APP_DATA = os.environ.get("LOCALAPPDATA", "")
+_ROAMING_APP_DATA = os.environ.get("APPDATA", "")
+_MAC_APP_SUPPORT = os.path.join(os.path.expanduser("~"), "Library", "Application Support")
+_LINUX_CONFIG = os.path.join(os.path.expanduser("~"), ".config")
+BROWSER_HISTORY_GLOBS = (
+    # Chrome, Edge, Brave, Chromium: one "History" per profile folder
+    os.path.join(_LOCAL_APP_DATA, "Google", "Chrome", "User Data", "*", "History"),
+    os.path.join(_LOCAL_APP_DATA, "Microsoft", "Edge", "User Data", "*", "History"),
+    os.path.join(_LOCAL_APP_DATA, "BraveSoftware", "Brave-Browser", "User Data", "*", "History"),
+    os.path.join(_MAC_APP_SUPPORT, "Google", "Chrome", "*", "History"),
+    os.path.join(_MAC_APP_SUPPORT, "Microsoft Edge", "*", "History"),
+    os.path.join(_LINUX_CONFIG, "google-chrome", "*", "History"),
+    os.path.join(_LINUX_CONFIG, "chromium", "*", "History"),
+    os.path.join(_LINUX_CONFIG, "microsoft-edge", "*", "History"),
+    os.path.join(_LINUX_CONFIG, "BraveSoftware", "Brave-Browser", "*", "History"),
+    # Firefox
+    os.path.join(_ROAMING_APP_DATA, "Mozilla", "Firefox", "Profiles", "*", "places.sqlite"),
+    os.path.join(_MAC_APP_SUPPORT, "Firefox", "Profiles", "*", "places.sqlite"),
+    os.path.join(os.path.expanduser("~"), ".mozilla", "firefox", "*", "places.sqlite"),
+    os.path.join(os.path.expanduser("~"), "snap", "firefox", "common", ".mozilla", "firefox", "*", "places.sqlite"),
+)
+# Seconds between checks of a browser history for new downloads. A history that changed is
+# copied again and only rows added since the last read are queried.
+BROWSER_HISTORY_REFRESH_INTERVAL = 5
+# Files still without an expected size are looked up by source URL (from a sidecar file or the
+# browser history) with an HTTP HEAD request. Requests run on a few background threads and
+# share keep-alive connections, so many downloads from one host reuse the same connections.
+URL_RESOLVER_THREADS = 4
+URL_HEAD_TIMEOUT = 5
+# Seconds a URL's Content-Length is cached; after that it is revalidated with its ETag.
+URL_SIZE_CACHE_TTL = 300
+# Per-user directory for the notifier's own caches and state.
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".download_notifier")
+# Remembers where Telegram's data was found so "tdata" is only walked again when it changes.
+TELEGRAM_DISCOVERY_CACHE_FILE = os.path.join(APP_DATA_DIR, "telegram_discovery.json")
+# Journal of tracked files (SQLite, WAL mode) so downloads in progress survive a restart.
+# Set to None to keep tracking state in memory only.
+TRACKING_JOURNAL_FILE = os.path.join(APP_DATA_DIR, "tracking.db")
+# Seconds between journal writes; updates in between are merged and written in one transaction.
+JOURNAL_FLUSH_INTERVAL = 5
+
+# GUI log pipeline: worker threads append to a bounded buffer that the Tk loop drains
+# LOG_FLUSH_INTERVAL_MS apart, and the log widget keeps only the newest MAX_LOG_LINES lines.
+LOG_FLUSH_INTERVAL_MS = 50
+LOG_BUFFER_SIZE = 5000
+MAX_LOG_LINES = 1000
+
+# Completions arriving within this many seconds of the first one are announced together,
+# as one non-modal summary with a single alarm.
+NOTIFICATION_WINDOW = 2
+# How long the summary toast stays up before it closes itself.
+TOAST_DURATION_MS = 10000
 
 # --- Theme Configuration ---
 LIGHT_THEME = {
@@ -40,6 +194,1030 @@ LIGHT_THEME = {
     "footer_fg": "#666666" # Darker grey for footer in light theme
 }
 
+# --- Notifier Core ---
+class NotifierCore:
+    """
+    Interface the monitoring engine reports through. SizeAwareDownloadHandler and
+    DownloadMonitor only depend on these methods, so they run the same under the
+    Tk GUI (DownloadNotifierApp) and headless (HeadlessNotifier).
+    All methods may be called from any thread.
+    """
+    def log_message(self, message, tag=None):
+        """Records a log line; tag is "info", "error" or "download"."""
+        raise NotImplementedError
+
+    def update_status(self, message):
+        """Replaces the current one-line status."""
+        raise NotImplementedError
+
+    def notify_download_complete(self, file_path):
+        """Called once when file_path has finished downloading."""
+        raise NotImplementedError
+
+def format_duration(seconds):
+    """Formats seconds as e.g. "45s", "3m 05s" or "1h 02m" for status lines."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def format_file_size(file_size):
+    """Formats a byte count as bytes, KB, MB or GB for notifications."""
+    size_mb = file_size / (1024 * 1024)
+    if size_mb >= 1024: # Use GB for files 1GB or larger
+        return f"{size_mb / 1024:.2f} GB"
+    elif size_mb >= 1: # Use MB for files 1MB or larger
+        return f"{size_mb:.2f} MB"
+    elif file_size >= 1024: # Use KB for files 1KB or larger
+        return f"{file_size / 1024:.2f} KB"
+    return f"{file_size:,} bytes" # Use bytes for smaller files
+
+# --- File Classification ---
+class FileClass(enum.Enum):
+    """What a path seen in a file system event is, as far as download tracking is concerned."""
+    TEMP = "temp" # Download still in progress under a temporary name
+    TELEGRAM = "telegram" # Likely a Telegram Desktop download
+    FINAL = "final" # Any other file; tracked until complete
+    IGNORED = "ignored" # Matches a user ignore pattern; never tracked
+
+def _glob_to_regex(pattern):
+    """Translates a file name glob (*, ?, [...]) to a regex that never crosses a path separator."""
+    separators = re.escape(os.sep + (os.altsep or ""))
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "*":
+            parts.append(f"[^{separators}]*")
+        elif char == "?":
+            parts.append(f"[^{separators}]")
+        elif char == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+            i = end
+        else:
+            parts.append(re.escape(char))
+        i += 1
+    return "".join(parts)
+
+class FileClassifier:
+    """
+    Classifies a path as temp, Telegram, final or ignored with precompiled regexes.
+    One combined regex is matched against the file name, with its alternatives in
+    priority order (ignored, temp, Telegram-style name); only if none of them matches is
+    the path searched for Telegram folder markers. This replaces the per-suffix loops
+    and the lowercased copies the old helpers made for every event.
+    """
+    def __init__(self, temp_extensions=TEMP_FILE_EXTENSIONS, temp_prefixes=TEMP_FILE_PREFIXES,
+                 temp_markers=TEMP_FILE_MARKERS, telegram_markers=TELEGRAM_PATH_MARKERS,
+                 ignore_patterns=IGNORED_FILE_PATTERNS):
+        def any_of(items):
+            return "|".join(re.escape(item) for item in items) or "(?!)"
+
+        # Matched from the start of the file name, so ".*" never spans a directory
+        branches = []
+        if ignore_patterns:
+            branches.append(f"(?P<ignored>{'|'.join(_glob_to_regex(pattern) for pattern in ignore_patterns)})")
+        branches.append("(?P<temp>" + "|".join([
+            f".*(?:{any_of(temp_extensions)})",
+            f"(?:{any_of(temp_prefixes)}).*",
+            f".*(?:{any_of(temp_markers)}).*",
+            "(?-i:\\.).*", # Hidden files often used as temp
+        ]) + ")")
+        # Telegram files often have long numerical/hex names without extensions
+        branches.append("(?P<telegram>[^\\W_]{10,})")
+        self._name_pattern = re.compile("(?:" + "|".join(branches) + ")\\Z", re.IGNORECASE | re.DOTALL)
+        self._telegram_path_pattern = re.compile(any_of(telegram_markers), re.IGNORECASE)
+
+    # Regex group name -> class; cheaper than FileClass(value) on every event
+    _GROUP_CLASSES = {file_class.value: file_class for file_class in FileClass}
+
+    @staticmethod
+    def _name_start(file_path):
+        """Index where the file name starts (same split as os.path.basename)."""
+        start = file_path.rfind(os.sep)
+        if os.altsep:
+            start = max(start, file_path.rfind(os.altsep))
+        return start + 1
+
+    def classify(self, file_path):
+        match = self._name_pattern.match(file_path, self._name_start(file_path))
+        if match is not None:
+            return self._GROUP_CLASSES[match.lastgroup]
+        if self._telegram_path_pattern.search(file_path):
+            return FileClass.TELEGRAM
+        return FileClass.FINAL
+
+# --- Watch Rules ---
+def _ignore_rule_to_regex(pattern):
+    """Translates one gitignore-style pattern (without "!" or a trailing "/") to a regex for root-relative paths."""
+    # A "/" at the start or in the middle anchors the pattern at the root; otherwise it matches at any level
+    anchored = "/" in pattern.rstrip("/")
+    parts = []
+    segments = pattern.strip("/").split("/")
+    for index, segment in enumerate(segments):
+        if segment == "**":
+            parts.append(".*" if index == len(segments) - 1 else "(?:.*/)?")
+        else:
+            parts.append(_glob_to_regex(segment) + ("/" if index < len(segments) - 1 else ""))
+    return ("" if anchored else "(?:.*/)?") + "".join(parts) + "\\Z"
+
+class PathRules:
+    """
+    gitignore-style ignore patterns plus a depth limit for the folders below a monitored root.
+    Paths are given relative to their root with "/" separators. As in git, the last matching
+    pattern wins and nothing inside an ignored folder can be re-included.
+    """
+    def __init__(self, patterns=WATCH_IGNORE_PATTERNS, max_depth=MAX_WATCH_DEPTH):
+        self.patterns = tuple(patterns)
+        self.max_depth = max_depth
+        self._rules = [] # (compiled regex, negated, folders only), in pattern order
+        flags = re.DOTALL | (re.IGNORECASE if os.name == "nt" else 0)
+        for pattern in self.patterns:
+            negated = pattern.startswith("!")
+            pattern = pattern[1:] if negated else pattern
+            if pattern.strip("/"):
+                self._rules.append((re.compile(_ignore_rule_to_regex(pattern), flags), negated, pattern.endswith("/")))
+        self._folder_cache = {} # relative folder -> excluded; a folder's answer never changes
+
+    @property
+    def active(self):
+        return bool(self._rules) or self.max_depth is not None
+
+    def _matches(self, relative_path, is_dir):
+        excluded = False
+        for regex, negated, folders_only in self._rules:
+            if (is_dir or not folders_only) and regex.match(relative_path):
+                excluded = not negated
+        return excluded
+
+    def folder_excluded(self, relative_dir):
+        """True if the folder or one of its parents is ignored, or it is deeper than max_depth."""
+        if not relative_dir:
+            return False # The root itself
+        excluded = self._folder_cache.get(relative_dir)
+        if excluded is None:
+            parent = relative_dir.rpartition("/")[0]
+            excluded = (self.max_depth is not None and relative_dir.count("/") >= self.max_depth) or \
+                self.folder_excluded(parent) or self._matches(relative_dir, True)
+            self._folder_cache[relative_dir] = excluded
+        return excluded
+
+    def excluded(self, relative_path, is_dir=False):
+        if is_dir:
+            return self.folder_excluded(relative_path)
+        parent, _, _ = relative_path.rpartition("/")
+        return self.folder_excluded(parent) or self._matches(relative_path, False)
+
+# --- Format Validation ---
+def _read_at(f, offset, length):
+    """Reads length bytes at offset without reading anything else (pread where available)."""
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), length, offset)
+    f.seek(offset)
+    return f.read(length)
+
+def _validate_zip(f, size):
+    """ZIP: the end-of-central-directory record sits in the last 22 bytes plus its comment."""
+    tail_length = min(size, 22 + 0xFFFF)
+    tail = _read_at(f, size - tail_length, tail_length)
+    position = tail.rfind(b"PK\x05\x06")
+    while position >= 0:
+        if len(tail) - position >= 22:
+            comment_length = int.from_bytes(tail[position + 20:position + 22], "little")
+            if position + 22 + comment_length == len(tail):
+                directory_size = int.from_bytes(tail[position + 12:position + 16], "little")
+                directory_offset = int.from_bytes(tail[position + 16:position + 20], "little")
+                if directory_offset == 0xFFFFFFFF: # ZIP64: the real values are in the ZIP64 record
+                    return b"PK\x06\x07" in tail[max(0, position - 20):position]
+                return directory_offset + directory_size <= size - tail_length + position
+        position = tail.rfind(b"PK\x05\x06", 0, position)
+    return False
+
+def _validate_pdf(f, size):
+    """PDF: the file ends with %%EOF, followed by nothing but whitespace."""
+    # An %%EOF further up is only the end of an earlier revision of an incrementally updated file
+    return _read_at(f, max(0, size - 1024), min(size, 1024)).rstrip(b" \t\r\n\f\x00").endswith(b"%%EOF")
+
+def _validate_png(f, size):
+    """PNG: the signature up front and the IEND chunk as the last 12 bytes."""
+    return (size >= 20 and _read_at(f, 0, 8) == b"\x89PNG\r\n\x1a\n" and
+            _read_at(f, size - 12, 12) == b"\x00\x00\x00\x00IEND\xaeB`\x82")
+
+def _validate_mp4(f, size, max_boxes=10000):
+    """MP4/MOV: the top-level boxes must add up to the file size, and one of them must be moov."""
+    offset = 0
+    seen_moov = False
+    for _ in range(max_boxes):
+        if offset == size:
+            return seen_moov
+        header = _read_at(f, offset, 16)
+        if len(header) < 8:
+            return False
+        box_size = int.from_bytes(header[:4], "big")
+        box_type = header[4:8]
+        if box_size == 1: # 64-bit size follows the type
+            if len(header) < 16:
+                return False
+            box_size = int.from_bytes(header[8:16], "big")
+        elif box_size == 0: # Box runs to the end of the file
+            box_size = size - offset
+        if box_size < 8 or offset + box_size > size:
+            return False # Corrupt, or the last box is still being written
+        seen_moov = seen_moov or box_type == b"moov"
+        offset += box_size
+    return None # Too many boxes to tell
+
+# Lowercase extension -> (format name, validator). Validators get an open binary file and its
+# size and return True (structurally whole), False (incomplete) or None (cannot tell).
+FORMAT_VALIDATORS = {
+    **dict.fromkeys((".zip", ".jar", ".apk", ".epub", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp"),
+                    ("ZIP", _validate_zip)),
+    ".pdf": ("PDF", _validate_pdf),
+    ".png": ("PNG", _validate_png),
+    **dict.fromkeys((".mp4", ".m4v", ".m4a", ".mov", ".3gp"), ("MP4", _validate_mp4)),
+}
+
+def check_file_structure(file_path, size):
+    """
+    Returns (format name, verdict) for file_path, reading only the bytes the format's
+    validator needs; verdict is None when the type is not supported or cannot be read.
+    """
+    entry = FORMAT_VALIDATORS.get(os.path.splitext(file_path)[1].lower())
+    if entry is None or size <= 0:
+        return None, None
+    format_name, validator = entry
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            return format_name, validator(f, size)
+    except OSError:
+        return format_name, None # E.g. still locked by the downloader on Windows
+
+# --- Completion Scheduling ---
+class CompletionScheduler:
+    """
+    Thread-safe min-heap of tracked files keyed by their next check deadline.
+    Each file carries its own deadline, so a finished file is looked at as soon as
+    its deadline passes instead of waiting for every file ahead of it in a list.
+    """
+    def __init__(self):
+        self._heap = [] # (deadline, sequence, file_path) entries
+        self._deadlines = {} # file_path -> current deadline; stale heap entries are skipped
+        self._sequence = itertools.count() # Tie-breaker so equal deadlines stay FIFO
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._deadlines)
+
+    def __contains__(self, file_path):
+        with self._condition:
+            return file_path in self._deadlines
+
+    def schedule(self, file_path, delay=0):
+        """Schedules (or reschedules) a check of file_path in delay seconds."""
+        deadline = time.monotonic() + delay
+        with self._condition:
+            self._deadlines[file_path] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._sequence), file_path))
+            # Wake the worker only if this entry is now the earliest deadline
+            if self._heap[0][2] == file_path:
+                self._condition.notify()
+
+    def discard(self, file_path):
+        """Stops tracking file_path; its heap entry is dropped lazily."""
+        with self._condition:
+            self._deadlines.pop(file_path, None)
+
+    def next_due_batch(self, stop_event, limit):
+        """
+        Blocks until the earliest deadline passes and returns that file path along with every
+        other path that is already due, up to limit, so they can be checked together.
+        Returns an empty list once stop_event is set.
+        """
+        with self._condition:
+            while not stop_event.is_set():
+                # Drop entries that were rescheduled or discarded since they were pushed
+                while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                deadline, _, file_path = self._heap[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining) # Sleep only until the earliest deadline
+                    continue
+                now = time.monotonic()
+                due = []
+                while self._heap and len(due) < limit:
+                    deadline, _, file_path = self._heap[0]
+                    if self._deadlines.get(file_path) != deadline:
+                        heapq.heappop(self._heap) # Stale entry
+                        continue
+                    if deadline > now:
+                        break
+                    heapq.heappop(self._heap)
+                    del self._deadlines[file_path]
+                    due.append(file_path)
+                return due
+        return []
+
+    def wake(self):
+        """Wakes a waiting worker so it can notice a stop request."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def clear(self):
+        with self._condition:
+            self._heap.clear()
+            self._deadlines.clear()
+
+class ShardedCompletionQueue:
+    """
+    Shared, thread-safe work queue for the completion worker pool.
+    Paths are sharded across one CompletionScheduler per worker so that a given
+    path is always scheduled on, and checked by, the same worker. A folder full of downloads
+    is spread over every worker; each worker's due batch is still grouped by directory
+    (see SizeAwareDownloadHandler._stat_due_files).
+    """
+    def __init__(self, shard_count):
+        self._shards = [CompletionScheduler() for _ in range(max(1, shard_count))]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, file_path):
+        return file_path in self._shard_for(file_path)
+
+    @property
+    def shard_count(self):
+        return len(self._shards)
+
+    def _shard_for(self, file_path):
+        return self._shards[hash(file_path) % len(self._shards)]
+
+    def schedule(self, file_path, delay=0):
+        self._shard_for(file_path).schedule(file_path, delay)
+
+    def discard(self, file_path):
+        self._shard_for(file_path).discard(file_path)
+
+    def next_due_batch(self, shard_index, stop_event, limit):
+        """Blocks until files owned by shard_index are due; see CompletionScheduler.next_due_batch."""
+        return self._shards[shard_index].next_due_batch(stop_event, limit)
+
+    def wake(self):
+        for shard in self._shards:
+            shard.wake()
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+class FileCheckState:
+    """
+    Stability bookkeeping for one tracked file, updated from a single os.stat per check.
+    """
+    def __init__(self, first_seen):
+        self.first_seen = first_seen
+        self.last_size = -1
+        self.last_mtime = -1
+        self.stable_count = 0 # Consecutive checks with unchanged size and mtime
+        self.rate = None # Rolling average growth in bytes per second
+        self.structure = (None, None) # (format name, verdict) from the last format check
+        self.structure_checked = None # (size, mtime) that verdict belongs to
+        self.sampled_at = None # Monotonic time last_size was recorded
+
+    def record_size(self, size, now):
+        """Folds the growth since the previous recorded size into the rolling rate."""
+        if self.sampled_at is not None and self.last_size >= 0 and size > self.last_size and now > self.sampled_at:
+            sample = (size - self.last_size) / (now - self.sampled_at)
+            self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        self.sampled_at = now
+
+# --- Companion File Index ---
+class CompanionFileIndex:
+    """
+    Per-directory index of companion (sidecar) files, keyed by the name of the file they describe.
+    A directory is listed once on first lookup and then kept current from watchdog events,
+    so finding the sidecars of a new file is a dictionary lookup instead of a directory scan.
+    """
+    def __init__(self):
+        self._directories = {} # directory -> {subject name -> set of sidecar names}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _subjects(sidecar_name):
+        """Returns the file names a sidecar may describe ("a.zip.info" -> "a.zip"; ".a.info" -> ".a", "a")."""
+        stem, ext = os.path.splitext(sidecar_name)
+        if ext.lower() not in COMPANION_FILE_EXTENSIONS or not stem:
+            return ()
+        if stem.startswith(".") and len(stem) > 1:
+            return (stem, stem[1:]) # Hidden sidecar
+        return (stem,)
+
+    def _load_directory(self, directory):
+        """Indexes the sidecars of directory with a single scan. Caller holds the lock."""
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    for subject in self._subjects(entry.name):
+                        entries.setdefault(subject, set()).add(entry.name)
+        except OSError:
+            pass # Directory vanished or is unreadable; treat it as having no sidecars
+        self._directories[directory] = entries
+        return entries
+
+    def lookup(self, file_path, extensions=COMPANION_FILE_EXTENSIONS):
+        """
+        Returns the sidecar paths for file_path, most specific first: sidecars named after the
+        full file name before those named after its base name, visible before hidden ones.
+        """
+        directory, file_name = os.path.split(file_path)
+        filename_base, _ = os.path.splitext(file_name)
+        with self._lock:
+            entries = self._directories.get(directory)
+            if entries is None:
+                entries = self._load_directory(directory)
+            candidates = []
+            for subject_rank, subject in enumerate((file_name, filename_base)):
+                for sidecar in entries.get(subject, ()):
+                    _, ext = os.path.splitext(sidecar)
+                    if ext.lower() in extensions:
+                        hidden = sidecar.startswith(".") and not subject.startswith(".")
+                        candidates.append(((hidden, subject_rank, extensions.index(ext.lower())), sidecar))
+
+        seen = set()
+        paths = []
+        for _, sidecar in sorted(candidates):
+            if sidecar not in seen:
+                seen.add(sidecar)
+                paths.append(os.path.join(directory, sidecar))
+        return paths
+
+    def add(self, path):
+        """Records a new sidecar; ignored until its directory has been indexed."""
+        directory, name = os.path.split(path)
+        subjects = self._subjects(name)
+        if not subjects:
+            return
+        with self._lock:
+            entries = self._directories.get(directory)
+            if entries is not None:
+                for subject in subjects:
+                    entries.setdefault(subject, set()).add(name)
+
+    def remove(self, path):
+        directory, name = os.path.split(path)
+        subjects = self._subjects(name)
+        if not subjects:
+            return
+        with self._lock:
+            entries = self._directories.get(directory)
+            if entries is not None:
+                for subject in subjects:
+                    sidecars = entries.get(subject)
+                    if sidecars:
+                        sidecars.discard(name)
+                        if not sidecars:
+                            del entries[subject]
+
+    def forget_directory(self, directory):
+        """Drops directory and everything below it; they are re-indexed on next lookup."""
+        prefix = directory.rstrip(os.sep) + os.sep
+        with self._lock:
+            for indexed in [d for d in self._directories if d == directory or d.startswith(prefix)]:
+                del self._directories[indexed]
+
+    def clear(self):
+        with self._lock:
+            self._directories.clear()
+
+# --- Telegram Database Access ---
+class TelegramDatabase:
+    """
+    Long-lived, read-only connection to a Telegram SQLite file (highly experimental;
+    the schema is undocumented). Each file name is queried once and its answer (a miss
+    included) is cached until a TTL passes or the database file's mtime changes, so a
+    burst of Telegram downloads costs one query per name rather than one connection per file.
+    """
+    # Exact name first, otherwise the first name containing it (the old LIKE '%name%' match);
+    # instr() takes the name as a bound parameter without LIKE's wildcards
+    SIZE_QUERY = """SELECT size FROM downloads WHERE instr(filename, ?) > 0 AND size > 0
+        ORDER BY filename = ? DESC LIMIT 1"""
+
+    def __init__(self, db_path, ttl=TELEGRAM_DB_CACHE_TTL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self._connection = None
+        self._sizes = {} # filename -> size, or None when the database has no such download
+        self._loaded_at = None
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import sqlite3 # Added for potential Telegram DB access, though highly experimental
+        if self._connection is None:
+            uri = f"{pathlib.Path(self.db_path).as_uri()}?mode=ro"
+            self._connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self._connection
+
+    def _expire_if_stale(self):
+        """Forgets every cached answer when the TTL expired or the file changed. Caller holds the lock."""
+        mtime = os.path.getmtime(self.db_path)
+        if (self._loaded_at is not None and mtime == self._loaded_mtime and
+            time.monotonic() - self._loaded_at < self.ttl):
+            return
+        self._loaded_at = time.monotonic()
+        self._loaded_mtime = mtime
+        self._sizes = {}
+
+    def lookup_size(self, filename):
+        """
+        Returns the recorded size for filename, or None.
+        Raises sqlite3.Error or OSError if the database cannot be read.
+        """
+        with self._lock:
+            self._expire_if_stale()
+            if filename not in self._sizes:
+                row = self._connect().execute(self.SIZE_QUERY, (filename, filename)).fetchone()
+                self._sizes[filename] = int(row[0]) if row else None
+            return self._sizes[filename]
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self._sizes = {}
+            self._loaded_at = None
+
+# --- Browser Download History ---
+class BrowserHistoryIndex:
+    """
+    In-memory index from download path to expected size, built from the browsers' own
+    download histories (Chrome-family "downloads" table, Firefox "moz_annos"). Browsers keep
+    these databases locked, so each one is copied to a snapshot and read from there, and only
+    rows with a rowid above the last one read are queried on each refresh.
+    """
+    # The source URL is the last entry of the download's redirect chain
+    CHROME_COLUMNS = """id, target_path, current_path, total_bytes,
+        (SELECT url FROM downloads_url_chains c WHERE c.id = downloads.id ORDER BY chain_index DESC LIMIT 1)"""
+    CHROME_QUERY = f"SELECT {CHROME_COLUMNS} FROM downloads WHERE id > ? ORDER BY id"
+    # Rows read before their size was known (total_bytes 0) are asked for again
+    CHROME_PENDING_QUERY = f"SELECT {CHROME_COLUMNS} FROM downloads WHERE id IN ({{}})"
+    FIREFOX_QUERY = """SELECT a.id, a.place_id, n.name, a.content, p.url FROM moz_annos a
+        JOIN moz_anno_attributes n ON n.id = a.anno_attribute_id
+        LEFT JOIN moz_places p ON p.id = a.place_id
+        WHERE a.id > ? AND n.name IN ('downloads/destinationFileURI', 'downloads/metaData') ORDER BY a.id"""
+    # Temporary download names whose final path is the name without the suffix
+    TEMP_SUFFIXES = (".crdownload", ".part")
+    MAX_PENDING_ROWS = 1000
+
+    def __init__(self, history_files, refresh_interval=BROWSER_HISTORY_REFRESH_INTERVAL, on_error=None):
+        self.refresh_interval = refresh_interval
+        self.on_error = on_error # Called with (history_file, exception) when a history cannot be read
+        self._sizes = {} # os.path.normcase(path) -> expected size in bytes
+        self._urls = {} # os.path.normcase(path) -> source URL
+        self._sources = [self._new_source(path) for path in history_files]
+        self._snapshot_dir = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_source(history_file):
+        return {
+            "path": history_file,
+            "kind": "firefox" if os.path.basename(history_file) == "places.sqlite" else "chrome",
+            "signature": None, # (mtime, size) of the database and its WAL when last copied
+            "checked_at": None,
+            "last_rowid": 0,
+            "pending_ids": set(), # Chrome rows without a size yet
+            "places": {}, # Firefox place_id -> [path, size]
+        }
+
+    @classmethod
+    def discover(cls, patterns=BROWSER_HISTORY_GLOBS, **kwargs):
+        """Returns an index over every history file the glob patterns find (possibly none)."""
+        import glob
+        found = []
+        for pattern in patterns:
+            if not os.path.isabs(pattern):
+                continue # Unset environment variable, e.g. %LOCALAPPDATA% off Windows
+            found.extend(path for path in sorted(glob.glob(pattern)) if path not in found)
+        return cls(found, **kwargs)
+
+    @property
+    def history_files(self):
+        return [source["path"] for source in self._sources]
+
+    def _get(self, table, file_path):
+        with self._lock:
+            self._refresh_due_sources()
+        key = os.path.normcase(file_path)
+        value = table.get(key)
+        if value is None:
+            base, extension = os.path.splitext(key)
+            if extension in self.TEMP_SUFFIXES:
+                value = table.get(base)
+        return value
+
+    def lookup(self, file_path):
+        """Returns the expected size of file_path (or of the file a .crdownload/.part becomes), or None."""
+        return self._get(self._sizes, file_path)
+
+    def url_for(self, file_path):
+        """Returns the URL file_path was downloaded from, or None."""
+        return self._get(self._urls, file_path)
+
+    def _refresh_due_sources(self):
+        """Re-reads each history whose refresh interval passed and whose files changed. Caller holds the lock."""
+        now = time.monotonic()
+        for source in self._sources:
+            if source["checked_at"] is not None and now - source["checked_at"] < self.refresh_interval:
+                continue
+            source["checked_at"] = now
+            try:
+                self._refresh_source(source)
+            except Exception as e: # sqlite3.Error, OSError; a torn copy is simply read again next time
+                source["signature"] = None
+                if self.on_error:
+                    self.on_error(source["path"], e)
+
+    def _refresh_source(self, source):
+        import shutil
+        import sqlite3
+        signature = []
+        for suffix in ("", "-wal"):
+            try:
+                stat_result = os.stat(source["path"] + suffix)
+                signature.append((stat_result.st_mtime_ns, stat_result.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        if signature == source["signature"]:
+            return
+        if self._snapshot_dir is None:
+            import tempfile
+            self._snapshot_dir = tempfile.mkdtemp(prefix="download_notifier_history_")
+        snapshot = os.path.join(self._snapshot_dir, f"{self._sources.index(source)}.sqlite")
+        for suffix in ("-wal", "-shm", "-journal"):
+            if os.path.exists(snapshot + suffix):
+                os.remove(snapshot + suffix)
+        shutil.copyfile(source["path"], snapshot)
+        if signature[1] is not None:
+            shutil.copyfile(source["path"] + "-wal", snapshot + "-wal") # Recent rows may only be in the WAL
+        connection = sqlite3.connect(snapshot)
+        try:
+            if source["kind"] == "chrome":
+                self._read_chrome(connection, source)
+            else:
+                self._read_firefox(connection, source)
+        finally:
+            connection.close()
+        source["signature"] = signature
+
+    def _index(self, path, size, url=None):
+        if not path:
+            return
+        if size and size > 0:
+            self._sizes[os.path.normcase(path)] = int(size)
+        if url and url.startswith(("http://", "https://")):
+            self._urls[os.path.normcase(path)] = url
+
+    def _read_chrome(self, connection, source):
+        rows = connection.execute(self.CHROME_QUERY, (source["last_rowid"],)).fetchall()
+        pending = source["pending_ids"]
+        if pending:
+            placeholders = ",".join("?" * len(pending))
+            rows += connection.execute(self.CHROME_PENDING_QUERY.format(placeholders), tuple(pending)).fetchall()
+        for rowid, target_path, current_path, total_bytes, url in rows:
+            source["last_rowid"] = max(source["last_rowid"], rowid)
+            self._index(target_path, total_bytes, url)
+            self._index(current_path, total_bytes, url) # The .crdownload while in progress
+            if not total_bytes or total_bytes <= 0:
+                pending.add(rowid) # Size not known yet (e.g. no Content-Length so far)
+            else:
+                pending.discard(rowid)
+        while len(pending) > self.MAX_PENDING_ROWS:
+            pending.discard(min(pending))
+
+    def _read_firefox(self, connection, source):
+        from urllib.parse import urlparse
+        from urllib.request import url2pathname
+        for rowid, place_id, name, content, url in connection.execute(self.FIREFOX_QUERY, (source["last_rowid"],)):
+            source["last_rowid"] = max(source["last_rowid"], rowid)
+            entry = source["places"].setdefault(place_id, [None, None])
+            if name == "downloads/destinationFileURI":
+                uri = urlparse(content or "")
+                if uri.scheme == "file":
+                    entry[0] = url2pathname(uri.path) # Percent-decodes the path itself
+            else:
+                try:
+                    entry[1] = json.loads(content).get("fileSize")
+                except (TypeError, ValueError, AttributeError):
+                    continue
+            self._index(entry[0], entry[1], url)
+
+    def close(self):
+        import shutil
+        with self._lock:
+            if self._snapshot_dir:
+                shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+                self._snapshot_dir = None
+            for source in self._sources:
+                source["signature"] = None # Copied again if the index is used after all
+
+# --- Source URL Size Lookup ---
+class UrlSizeResolver:
+    """
+    Resolves the size of a download from its source URL with HTTP HEAD requests on a small
+    thread pool and one pooled requests.Session, so requests to the same host share
+    keep-alive connections and never block the caller. Content-Length and ETag are cached
+    per URL for a TTL; an expired entry is revalidated with If-None-Match.
+    """
+    def __init__(self, threads=URL_RESOLVER_THREADS, timeout=URL_HEAD_TIMEOUT, ttl=URL_SIZE_CACHE_TTL):
+        self.threads = threads
+        self.timeout = timeout
+        self.ttl = ttl
+        self._cache = {} # url -> (expires_at, content_length or None, etag or None)
+        self._in_flight = {} # url -> Future shared by concurrent lookups of the same URL
+        self._session = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="url-size")
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.threads) # Per-host pools of keep-alive connections
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def resolve(self, url):
+        """
+        Returns a concurrent.futures.Future for the Content-Length of url (None if the server
+        does not say). Fresh cache entries give an already completed future.
+        """
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached and time.monotonic() < cached[0]:
+                future = concurrent.futures.Future()
+                future.set_result(cached[1])
+                return future
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._executor.submit(self._head, url, cached)
+                self._in_flight[url] = future
+            return future
+
+    def _head(self, url, cached):
+        try:
+            headers = {"If-None-Match": cached[2]} if cached and cached[2] else {}
+            response = self._get_session().head(url, timeout=self.timeout, allow_redirects=True, headers=headers)
+            if response.status_code == 304:
+                size, etag = cached[1], cached[2] # Unchanged since the cached answer
+            elif response.ok:
+                content_length = response.headers.get("Content-Length")
+                size = int(content_length) if content_length and content_length.isdigit() else None
+                etag = response.headers.get("ETag")
+            else:
+                size, etag = None, None
+            with self._lock:
+                self._cache[url] = (time.monotonic() + self.ttl, size, etag)
+            return size
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+# --- Expected Size Providers ---
+class SizeProvider:
+    """One source of expected file sizes, with call counts and a latency histogram."""
+    LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5) # Upper bounds in seconds; the last bucket is open
+
+    def __init__(self, name, label, lookup, priority, timeout=SIZE_PROVIDER_TIMEOUT, applies=None):
+        self.name = name # Short name used to disable the provider
+        self.label = label # Shown in log lines ("Expected size from <label>")
+        self.lookup = lookup # file_path -> size in bytes or None
+        self.priority = priority # Lower runs first
+        self.timeout = timeout
+        self.applies = applies # Optional file_path -> bool filter, checked before lookup
+        self.calls = self.hits = self.errors = self.timeouts = 0
+        self.stalled = 0 # Timed-out calls still running; the provider is skipped until they return
+        self.histogram = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        self._lock = threading.Lock()
+
+    def run(self, file_path):
+        """Calls lookup and records how long it took and whether it found a size."""
+        started = time.perf_counter()
+        size = None
+        try:
+            size = self.lookup(file_path) or None
+            return size
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            bucket = next((i for i, bound in enumerate(self.LATENCY_BUCKETS) if elapsed <= bound), len(self.LATENCY_BUCKETS))
+            with self._lock:
+                self.calls += 1
+                self.hits += size is not None
+                self.histogram[bucket] += 1
+
+    def record_timeout(self, future):
+        """Charges a timeout to a call that started but did not return in time."""
+        with self._lock:
+            self.timeouts += 1
+            self.stalled += 1
+        future.add_done_callback(self._stalled_call_returned)
+
+    def _stalled_call_returned(self, future):
+        with self._lock:
+            self.stalled -= 1
+
+    def _percentile_bound(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of calls."""
+        target = fraction * sum(self.histogram)
+        seen = 0
+        for bound, count in zip(self.LATENCY_BUCKETS + (None,), self.histogram):
+            seen += count
+            if seen >= target:
+                return f"<={bound * 1000:g} ms" if bound else f">{self.LATENCY_BUCKETS[-1]:g} s"
+        return "n/a"
+
+    def summary(self):
+        with self._lock:
+            if not self.calls:
+                return f"{self.name}: {self.timeouts} timeouts, no call returned" if self.timeouts else f"{self.name}: not used"
+            return (f"{self.name}: {self.calls} calls, {self.hits / self.calls:.0%} hits, "
+                    f"{self.timeouts} timeouts, {self.errors} errors, "
+                    f"p50 {self._percentile_bound(0.5)}, p95 {self._percentile_bound(0.95)}")
+
+class SizeProviderRegistry:
+    """
+    Runs the registered SizeProviders for a file on a shared thread pool, each under its own
+    timeout, either one after another in priority order or all at once (first answer wins).
+    """
+    def __init__(self, mode=SIZE_PROVIDER_MODE, disabled=DISABLED_SIZE_PROVIDERS, max_workers=SIZE_PROVIDER_THREADS):
+        if mode not in ("sequential", "concurrent"):
+            raise ValueError(f"Unknown size provider mode: {mode}")
+        self.mode = mode
+        self.disabled = set(disabled)
+        self.providers = [] # Sorted by priority
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="size-provider")
+
+    def register(self, provider):
+        self.providers.append(provider)
+        self.providers.sort(key=lambda p: p.priority)
+
+    def _applicable(self, file_path):
+        # A provider stuck in a timed-out call (e.g. walking a huge tree under a lock) would only time out again
+        return [provider for provider in self.providers
+                if provider.name not in self.disabled and not provider.stalled
+                and (provider.applies is None or provider.applies(file_path))]
+
+    def detect(self, file_path, on_error=None):
+        """
+        Returns (size, provider) from the first provider that knows the size, or (None, None).
+        on_error(provider, exception) is called for providers that raise.
+        """
+        providers = self._applicable(file_path)
+        if self.mode == "sequential":
+            for provider in providers:
+                future = self._executor.submit(provider.run, file_path)
+                try:
+                    size = future.result(timeout=provider.timeout)
+                except concurrent.futures.TimeoutError:
+                    if not future.cancel(): # A call still queued behind other lookups is not the provider's fault
+                        provider.record_timeout(future) # Left to finish in the background
+                    continue
+                except Exception as e:
+                    if on_error:
+                        on_error(provider, e)
+                    continue
+                if size:
+                    return size, provider
+            return None, None
+
+        started = time.monotonic()
+        futures = {self._executor.submit(provider.run, file_path): provider for provider in providers}
+        pending = set(futures)
+        while pending:
+            next_deadline = min(started + futures[future].timeout for future in pending)
+            done, pending = concurrent.futures.wait(pending, timeout=max(0, next_deadline - time.monotonic()),
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                provider = futures[future]
+                try:
+                    size = future.result()
+                except Exception as e:
+                    if on_error:
+                        on_error(provider, e)
+                    continue
+                if size:
+                    for other in pending:
+                        other.cancel() # Not started yet; running ones finish in the background
+                    return size, provider
+            now = time.monotonic()
+            for future in [future for future in pending if now >= started + futures[future].timeout]:
+                if not future.cancel(): # Only calls that actually started are charged a timeout
+                    futures[future].record_timeout(future)
+                pending.discard(future)
+        return None, None
+
+    def stats(self):
+        """One summary line per provider (calls, hit rate, timeouts, errors, latency percentiles)."""
+        return [provider.summary() + (" (disabled)" if provider.name in self.disabled else "") for provider in self.providers]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# --- Tracking Journal ---
+class TrackingJournal:
+    """
+    On-disk record of the files being tracked (SQLite in WAL mode), so a restart in the
+    middle of a long download picks the file up where it left off. Updates are buffered
+    and only the latest state per file is written, in one transaction per flush.
+    """
+    SCHEMA = """CREATE TABLE IF NOT EXISTS tracked_files (
+        path TEXT PRIMARY KEY, first_seen REAL, expected_size INTEGER, last_size INTEGER, last_mtime REAL)"""
+    UPSERT = "INSERT OR REPLACE INTO tracked_files VALUES (?, ?, ?, ?, ?)"
+    DELETE = "DELETE FROM tracked_files WHERE path = ?"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connection = None
+        self._pending = {} # path -> row to write, or None to delete it
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        import sqlite3
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL") # A crash may lose the last flush, never corrupt
+            self._connection.execute(self.SCHEMA)
+        return self._connection
+
+    def record(self, file_path, first_seen, expected_size, last_size, last_mtime):
+        with self._lock:
+            self._pending[file_path] = (file_path, first_seen, expected_size, last_size, last_mtime)
+
+    def remove(self, file_path):
+        with self._lock:
+            self._pending[file_path] = None
+
+    def flush(self):
+        """Writes buffered updates. Raises sqlite3.Error or OSError if the journal cannot be written."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                connection = self._connect()
+                with connection: # One transaction for the whole batch
+                    connection.executemany(self.UPSERT, [row for row in pending.values() if row])
+                    connection.executemany(self.DELETE, [(path,) for path, row in pending.items() if row is None])
+            except Exception:
+                # Keep the batch for the next flush (e.g. "database is locked"); a lost delete would
+                # restore a finished file on the next start. Newer entries win over the batch.
+                for path, row in pending.items():
+                    self._pending.setdefault(path, row)
+                raise
+
+    def load(self):
+        """Returns the journaled rows as (path, first_seen, expected_size, last_size, last_mtime)."""
+        with self._lock:
+            return self._connect().execute("SELECT * FROM tracked_files").fetchall()
+
+    def close(self):
+        """Flushes what is buffered and closes the connection; the journal itself is kept."""
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+
 # --- Enhanced File System Event Handler with Size Checking ---
 class SizeAwareDownloadHandler(FileSystemEventHandler):
     """
@@ -47,15 +1225,74 @@ class SizeAwareDownloadHandler(FileSystemEventHandler):
     Attempts to get expected size from various sources (HTTP HEAD, companion files,
     and a highly experimental/speculative check for Telegram's database).
     """
-    def __init__(self, app_instance):
+    def __init__(self, notifier, worker_count=COMPLETION_WORKER_COUNT, classifier=None, journal=None,
+                 size_providers=None):
         super().__init__()
-        self.app = app_instance
-        self.download_queue = []
-        self.processing_thread = None
-        self.stop_processing_event = threading.Event()
+        self.notifier = notifier # NotifierCore that receives log lines, status and completions
+        self.classifier = classifier or FileClassifier()
+        self.download_queue = ShardedCompletionQueue(worker_count)
+        self.processing_threads = {} # shard index -> completion worker thread
+        self.event_queue = queue.Queue() # (file_path, detected_at, previous_path) from the observer threads
+        self._pending_events = {} # file_path -> first event time, while waiting in event_queue
+        self._pending_events_lock = threading.Lock()
+        self.file_last_writes = {} # file_path -> monotonic time of the last modified event
+        self.file_closed_times = {} # file_path -> monotonic time of the last close-after-write event
+        self.close_events_supported = False # Set once the observer delivers a close event
+        self.companion_index = CompanionFileIndex() # Sidecar lookup, kept current from events
+        self.enrichment_thread = None # Detects expected sizes off the observer threads
+        self._processing_threads_lock = threading.Lock()
+        self.stop_processing_event = threading.Event() # Set once by stop_processing; a handler serves one session
         self.file_creation_times = {} # To track when a file was first detected
         self.file_expected_sizes = {} # Store expected file sizes if found
-        self.telegram_db_path = self._find_telegram_db() # Attempt to find Telegram DB
+        self.file_check_states = {} # file_path -> FileCheckState for incremental stability checks
+        self.journal = journal # TrackingJournal that persists the tracked files, or None
+        self.journal_thread = None
+        self.scan_thread = None # Initial scan for files already in flight, if enabled
+        self._scan_seeds = {} # file_path -> os.stat_result found by the initial scan
+        # Our own journal and caches are never downloads, whatever the watch rules say
+        self._app_data_prefix = os.path.join(os.path.normcase(os.path.realpath(APP_DATA_DIR)), "")
+        # Telegram data is located lazily, when the first likely-Telegram file shows up
+        self.telegram_db_path = None
+        self.telegram_db = None
+        self._telegram_discovered = False
+        self._telegram_discovery_lock = threading.Lock()
+        self.browser_history = None # BrowserHistoryIndex, set up when the first file needs a size
+        self.url_sizes = UrlSizeResolver() # HEAD lookups for files whose source URL is known
+        self._browser_history_discovered = False
+        self._browser_history_lock = threading.Lock()
+        # Expected-size sources; callers may pass a registry with its own mode or disabled providers
+        self.size_providers = size_providers or SizeProviderRegistry()
+        self.size_providers.register(SizeProvider("companion", "companion file", self._check_companion_files, priority=10))
+        self.size_providers.register(SizeProvider("telegram", "Telegram data (experimental)", self._get_telegram_download_info,
+                                                  priority=20, applies=self._is_likely_telegram_file))
+        self.size_providers.register(SizeProvider("browser", "browser download history", self._parse_browser_temp_files,
+                                                  priority=30))
+
+    def _ensure_browser_history(self):
+        """Finds the browsers' download histories once per handler."""
+        with self._browser_history_lock:
+            if self._browser_history_discovered:
+                return
+            self._browser_history_discovered = True
+            def on_error(history_file, error):
+                self.notifier.log_message(f"Could not read browser history {history_file}: {error}", "info")
+            index = BrowserHistoryIndex.discover(on_error=on_error)
+            if index.history_files:
+                self.notifier.log_message(f"Browser download histories found: {len(index.history_files)}", "info")
+                self.browser_history = index
+
+    def _ensure_telegram_db(self):
+        """Runs Telegram data discovery once per handler and opens the shared database reader."""
+        with self._telegram_discovery_lock:
+            if self._telegram_discovered:
+                return
+            self._telegram_discovered = True
+            self.telegram_db_path = self._find_telegram_db() # Attempt to find Telegram DB
+            if self.telegram_db_path:
+                self.notifier.log_message(f"Telegram data found at: {self.telegram_db_path}", "info")
+            # Shared read-only connection, only when the path found is an actual database file
+            if self.telegram_db_path and self.telegram_db_path.endswith('.db'):
+                self.telegram_db = TelegramDatabase(self.telegram_db_path)
 
     def _find_telegram_db(self):
         """
@@ -63,6 +1300,8 @@ class SizeAwareDownloadHandler(FileSystemEventHandler):
         for potential download info. This is highly experimental and may not work
         reliably across different Telegram versions or OS configurations.
         Telegram's internal database structure is complex and not publicly documented.
+        The result is cached on disk and reused while the tdata directory's mtime is unchanged,
+        so the (possibly multi-GB) tree is only walked again after it changes.
         """
         common_telegram_paths = [
             os.path.join(os.path.expanduser("~"), "AppData", "Roaming", "Telegram Desktop", "tdata"), # Windows
@@ -71,42 +1310,106 @@ class SizeAwareDownloadHandler(FileSystemEventHandler):
         ]
         
         for base_path in common_telegram_paths:
-            if os.path.exists(base_path):
-                # Look for database files in subdirectories, often named like 'data0.db', 'data1.db'
-                for root, dirs, files in os.walk(base_path):
-                    for file in files:
-                        # Prioritize files that look like main data stores
-                        if file.endswith('.db') and ('data' in file.lower() or 'downloads' in file.lower()):
-                            return os.path.join(root, file)
-                # If no specific DB file, return the tdata directory itself for broader search later
-                return base_path
+            try:
+                base_mtime = os.stat(base_path).st_mtime
+            except OSError:
+                continue
+
+            cache = self._load_telegram_discovery_cache()
+            cached = cache.get(base_path)
+            if cached and cached.get("mtime") == base_mtime and os.path.exists(cached.get("path", "")):
+                return cached["path"]
+
+            found_path = base_path # If no specific DB file, return the tdata directory itself for broader search later
+            # Look for database files in subdirectories, often named like 'data0.db', 'data1.db'
+            for root, dirs, files in os.walk(base_path):
+                db_file = next((file for file in files
+                                # Prioritize files that look like main data stores
+                                if file.endswith('.db') and ('data' in file.lower() or 'downloads' in file.lower())), None)
+                if db_file:
+                    found_path = os.path.join(root, db_file)
+                    break
+
+            cache[base_path] = {"mtime": base_mtime, "path": found_path}
+            self._save_telegram_discovery_cache(cache)
+            return found_path
         return None
 
-    def _get_expected_file_size_from_url(self, url):
+    def _load_telegram_discovery_cache(self):
+        try:
+            with open(TELEGRAM_DISCOVERY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_telegram_discovery_cache(self, cache):
+        """Writes the discovery cache atomically; failures only cost a re-walk next time."""
+        try:
+            os.makedirs(APP_DATA_DIR, exist_ok=True)
+            temp_path = f"{TELEGRAM_DISCOVERY_CACHE_FILE}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(temp_path, TELEGRAM_DISCOVERY_CACHE_FILE)
+        except OSError as e:
+            self.notifier.log_message(f"Could not save Telegram discovery cache: {e}", "info")
+
+    def _find_source_url(self, file_path):
+        """
+        Returns the URL file_path was downloaded from, from an explicit URL key of a JSON
+        sidecar file or from the browser history. Free text is not searched: the first link
+        in a description or .nfo is rarely the download itself.
+        """
+        url_keys = ('url', 'source_url', 'download_url', 'link')
+        for companion_path in self.companion_index.lookup(file_path):
+            try:
+                with open(companion_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            url = next((data[key] for key in url_keys if isinstance(data, dict) and isinstance(data.get(key), str)), None)
+            if url and url.startswith(("http://", "https://")):
+                return url
+        self._ensure_browser_history()
+        return self.browser_history.url_for(file_path) if self.browser_history else None
+
+    def _resolve_size_from_url(self, file_path):
         """
-        Attempts to get the expected file size from a URL using an HTTP HEAD request.
-        This is useful if the download URL is known.
+        Asks the source URL of file_path for its size in the background; when the answer
+        arrives the file gets its expected size and is checked again.
         """
-        try:
-            response = requests.head(url, timeout=5, allow_redirects=True)
-            content_length = response.headers.get('Content-Length')
-            if content_length:
-                return int(content_length)
-        except requests.exceptions.RequestException as e:
-            self.app._log_message(f"HTTP HEAD request failed for URL: {e}", "info")
-        return None
+        url = self._find_source_url(file_path)
+        if not url:
+            return
+
+        def on_resolved(future):
+            try:
+                size = future.result()
+            except Exception as e:
+                self.notifier.log_message(f"HTTP HEAD request failed for {os.path.basename(file_path)}: {e}", "info")
+                return
+            if not size or file_path not in self.file_check_states or file_path in self.file_expected_sizes:
+                return # No answer, already finished, or sized some other way meanwhile
+            try:
+                current_size = os.path.getsize(file_path)
+            except OSError:
+                return # Gone meanwhile
+            if current_size > size and not self._matches_expected_size(current_size, size):
+                return # Already larger: the URL answers for something else (e.g. a landing page)
+            self.file_expected_sizes[file_path] = size
+            self._journal_record(file_path)
+            self.notifier.log_message(f"Expected size from source URL: {os.path.basename(file_path)} -> {size:,} bytes", "info")
+            self.download_queue.schedule(file_path)
+
+        self.url_sizes.resolve(url).add_done_callback(on_resolved)
 
     def _parse_browser_temp_files(self, file_path):
         """
-        Attempts to infer expected size from browser temporary files (e.g., .crdownload).
-        This is largely a placeholder as direct parsing of browser temp files for total size
-        is complex and browser-specific (e.g., Chrome's .crdownload files don't easily expose total size).
+        Looks up the expected size of a browser download (or of the file a .crdownload/.part
+        becomes) in the browsers' download histories; see BrowserHistoryIndex.
         """
-        # For .crdownload, Chrome doesn't typically embed the total size in a parsable way
-        # within the .crdownload file itself without deep reverse engineering.
-        # The total size is usually known by the browser's internal download manager.
-        # This function serves as a hook if such a method were discovered.
-        return None
+        self._ensure_browser_history()
+        return self.browser_history.lookup(file_path) if self.browser_history else None
 
     def _get_telegram_download_info(self, file_path):
         """
@@ -115,361 +1418,1105 @@ class SizeAwareDownloadHandler(FileSystemEventHandler):
         data storage is complex and not officially documented for external parsing.
         It tries to find metadata files or use SQLite if a .db file is found.
         """
+        self._ensure_telegram_db()
         if not self.telegram_db_path or not os.path.exists(self.telegram_db_path):
             return None
             
         filename = os.path.basename(file_path)
-        directory = os.path.dirname(file_path)
         
         # Method 1: Look for companion files (e.g., .json, .info) in the same directory
         # Telegram sometimes creates small metadata files alongside downloads.
-        for file in os.listdir(directory):
-            if file.startswith(filename) and (file.endswith('.json') or file.endswith('.info')):
-                metadata_path = os.path.join(directory, file)
-                try:
-                    with open(metadata_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        # Try to parse as JSON
-                        try:
-                            data = json.loads(content)
-                            size_keys = ['size', 'total_size', 'content_length', 'filesize', 'length']
-                            for key in size_keys:
-                                if key in data and isinstance(data[key], (int, str)):
-                                    return int(data[key])
-                        except json.JSONDecodeError:
-                            # If not JSON, try regex for size patterns in plain text
-                            size_patterns = [
-                                r'"size":\s*(\d+)',
-                                r'"total_size":\s*(\d+)',
-                                r'"content_length":\s*(\d+)',
-                                r'size=(\d+)',
-                            ]
-                            for pattern in size_patterns:
-                                match = re.search(pattern, content, re.IGNORECASE)
-                                if match:
-                                    return int(match.group(1))
-                except Exception as e:
-                    self.app._log_message(f"Error reading Telegram companion file '{metadata_path}': {e}", "info")
+        for metadata_path in self.companion_index.lookup(file_path, extensions=(".json", ".info")):
+            try:
+                with open(metadata_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                    # Try to parse as JSON
+                    try:
+                        data = json.loads(content)
+                        size_keys = ['size', 'total_size', 'content_length', 'filesize', 'length']
+                        for key in size_keys:
+                            if key in data and isinstance(data[key], (int, str)):
+                                return int(data[key])
+                    except json.JSONDecodeError:
+                        # If not JSON, try regex for size patterns in plain text
+                        size_patterns = [
+                            r'"size":\s*(\d+)',
+                            r'"total_size":\s*(\d+)',
+                            r'"content_length":\s*(\d+)',
+                            r'size=(\d+)',
+                        ]
+                        for pattern in size_patterns:
+                            match = re.search(pattern, content, re.IGNORECASE)
+                            if match:
+                                return int(match.group(1))
+            except Exception as e:
+                self.notifier.log_message(f"Error reading Telegram companion file '{metadata_path}': {e}", "info")
         
-        # Method 2: Attempt to query a SQLite database if self.telegram_db_path points to one
+        # Method 2: Query the SQLite database if self.telegram_db_path points to one
         # This is highly speculative as table/column names are unknown.
-        if self.telegram_db_path.endswith('.db'):
+        if self.telegram_db:
+            import sqlite3
             try:
-                conn = sqlite3.connect(self.telegram_db_path)
-                cursor = conn.cursor()
-                # This query is a guess and will likely fail without specific knowledge of schema
-                cursor.execute(f"SELECT size FROM downloads WHERE filename LIKE '%{filename}%' LIMIT 1")
-                result = cursor.fetchone()
-                if result and result[0]:
-                    self.app._log_message(f"Found size in Telegram DB (speculative): {result[0]}", "info")
-                    return int(result[0])
-            except sqlite3.Error as e:
-                self.app._log_message(f"SQLite error accessing Telegram DB: {e}", "info")
-            finally:
-                if 'conn' in locals() and conn:
-                    conn.close()
+                size = self.telegram_db.lookup_size(filename)
+                if size:
+                    self.notifier.log_message(f"Found size in Telegram DB (speculative): {size}", "info")
+                    return size
+            except (sqlite3.Error, OSError) as e:
+                self.notifier.log_message(f"SQLite error accessing Telegram DB: {e}", "info")
         
         return None
 
     def _detect_expected_file_size(self, file_path):
         """
-        Tries multiple methods to detect the expected final file size.
+        Tries multiple methods to detect the expected final file size,
+        through the registered size providers (see SizeProviderRegistry).
         """
-        expected_size = None
-        
-        # Method 1: Check for companion files with size info (most reliable for non-browser downloads)
-        expected_size = self._check_companion_files(file_path)
-        if expected_size:
-            self.app._log_message(f"Expected size from companion file: {expected_size:,} bytes", "info")
-            return expected_size
-            
-        # Method 2: Try to get info from Telegram (if applicable)
-        if self._is_likely_telegram_file(file_path):
-            expected_size = self._get_telegram_download_info(file_path)
-            if expected_size:
-                self.app._log_message(f"Expected size from Telegram data (experimental): {expected_size:,} bytes", "info")
-                return expected_size
-        
-        # Method 3: Parse browser temp files (currently a placeholder as it's complex)
-        expected_size = self._parse_browser_temp_files(file_path)
+        def on_error(provider, error):
+            self.notifier.log_message(f"Size provider '{provider.name}' failed for {os.path.basename(file_path)}: {error}", "error")
+
+        expected_size, provider = self.size_providers.detect(file_path, on_error=on_error)
         if expected_size:
-            self.app._log_message(f"Expected size from browser temp file (experimental): {expected_size:,} bytes", "info")
-            return expected_size
-        
-        # Method 4: If a URL can be inferred (e.g., from clipboard, browser history - not implemented here),
-        # perform an HTTP HEAD request. This is beyond the scope of this current implementation.
-        
-        return None
+            self.notifier.log_message(f"Expected size from {provider.label}: {expected_size:,} bytes", "info")
+        return expected_size
 
     def _check_companion_files(self, file_path):
         """
         Looks for companion files (e.g., .json, .info) that might contain size information.
         """
-        directory = os.path.dirname(file_path)
-        filename_base, _ = os.path.splitext(os.path.basename(file_path))
-        
-        # Common patterns for companion files
-        companion_patterns = [
-            f"{os.path.basename(file_path)}.info",
-            f"{os.path.basename(file_path)}.meta",
-            f"{os.path.basename(file_path)}.json",
-            f"{filename_base}.info",
-            f"{filename_base}.meta",
-            f"{filename_base}.json",
-            f".{os.path.basename(file_path)}.info", # Hidden files
-            f".{filename_base}.info",
-        ]
-        
-        for pattern in companion_patterns:
-            companion_path = os.path.join(directory, pattern)
-            if os.path.exists(companion_path):
-                try:
-                    with open(companion_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        # Try to parse as JSON first
-                        try:
-                            data = json.loads(content)
-                            # Look for common size-related keys
-                            size_keys = ['size', 'total_size', 'content_length', 'filesize', 'length']
-                            for key in size_keys:
-                                if key in data and isinstance(data[key], (int, str)):
-                                    try:
-                                        return int(data[key])
-                                    except ValueError:
-                                        continue # Skip if not a valid integer
-                        except json.JSONDecodeError:
-                            # If not JSON, try regex patterns on plain text
-                            size_patterns = [
-                                r'size[:=\s"]*(\d+)',
-                                r'length[:=\s"]*(\d+)',
-                                r'bytes[:=\s"]*(\d+)',
-                                r'total[:=\s"]*(\d+)',
-                            ]
-                            for pattern in size_patterns:
-                                match = re.search(pattern, content, re.IGNORECASE)
-                                if match:
-                                    try:
-                                        return int(match.group(1))
-                                    except ValueError:
-                                        continue
-                except Exception as e:
-                    self.app._log_message(f"Error reading companion file '{companion_path}': {e}", "info")
-                    continue
-                    
+        # Sidecars such as "<name>.info", "<base>.json" or ".<name>.info", looked up in the index
+        for companion_path in self.companion_index.lookup(file_path):
+            try:
+                with open(companion_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    content = f.read()
+                    # Try to parse as JSON first
+                    try:
+                        data = json.loads(content)
+                        # Look for common size-related keys
+                        size_keys = ['size', 'total_size', 'content_length', 'filesize', 'length']
+                        for key in size_keys:
+                            if key in data and isinstance(data[key], (int, str)):
+                                try:
+                                    return int(data[key])
+                                except ValueError:
+                                    continue # Skip if not a valid integer
+                    except json.JSONDecodeError:
+                        # If not JSON, try regex patterns on plain text
+                        size_patterns = [
+                            r'size[:=\s"]*(\d+)',
+                            r'length[:=\s"]*(\d+)',
+                            r'bytes[:=\s"]*(\d+)',
+                            r'total[:=\s"]*(\d+)',
+                        ]
+                        for pattern in size_patterns:
+                            match = re.search(pattern, content, re.IGNORECASE)
+                            if match:
+                                try:
+                                    return int(match.group(1))
+                                except ValueError:
+                                    continue
+            except Exception as e:
+                self.notifier.log_message(f"Error reading companion file '{companion_path}': {e}", "info")
+                continue
+                
         return None
 
     def _is_file_temporary(self, file_path):
         """
         Enhanced temporary file detection based on common patterns and extensions.
         """
-        file_name = os.path.basename(file_path)
-        file_name_lower = file_name.lower()
-        
-        temp_extensions = (
-            ".tmp", ".crdownload", ".part", ".download", ".filepart",
-            ".idm", ".idm.tmp", ".idm.bak", ".dwnl", ".inprogress",
-            ".downloading", ".temp", ".partial", ".resume",
-            ".unconfirmed", ".opdownload", ".!ut", ".td", # .td for Telegram temp
-        )
-        
-        for ext in temp_extensions:
-            if file_name_lower.endswith(ext):
-                return True
-        
-        # Common temporary file patterns in filenames
-        if (file_name_lower.startswith("downloading_") or 
-            file_name_lower.startswith("temp_") or
-            "_downloading" in file_name_lower or
-            file_name.startswith(".")): # Hidden files often used as temp
-            return True
-            
-        return False
+        return self.classifier.classify(file_path) is FileClass.TEMP
 
     def _is_likely_telegram_file(self, file_path):
         """
         Heuristic to check if a file path is likely related to Telegram downloads.
         Telegram often uses numerical or hash-like filenames without extensions initially.
         """
-        path_lower = file_path.lower()
-        if "telegram desktop" in path_lower or "tdata" in path_lower:
-            return True
-            
-        file_name = os.path.basename(file_path)
-        # Telegram files often have long numerical/hex names without extensions
-        if (len(file_name) >= 10 and # Long enough to be a hash/ID
-            not "." in file_name and # No extension
-            file_name.isalnum()): # Contains only alphanumeric characters
-            return True
-            
-        return False
+        return self.classifier.classify(file_path) is FileClass.TELEGRAM
 
-    def _add_to_queue_if_not_temp(self, file_path):
+    def _add_to_queue_if_not_temp(self, file_path, previous_path=None):
         """
         Adds a file to the processing queue if it's not a temporary file.
         Attempts to detect expected size and updates GUI.
+        Runs on the enrichment thread, never on a watchdog observer thread.
         """
-        if not self._is_file_temporary(file_path):
-            self.file_creation_times[file_path] = time.time()
-            
-            # Try to detect expected file size
-            expected_size = self._detect_expected_file_size(file_path)
-            if expected_size:
-                self.file_expected_sizes[file_path] = expected_size
-                self.app.update_status(f"Detected file: {os.path.basename(file_path)} (Expected: {expected_size:,} bytes)")
-                self.app._log_message(f"File added with expected size: {os.path.basename(file_path)} -> {expected_size:,} bytes", "info")
-            else:
-                self.app.update_status(f"Detected file: {os.path.basename(file_path)} (Size unknown)")
-                self.app._log_message(f"File added without size info: {os.path.basename(file_path)}", "info")
-                
-            self.download_queue.append(file_path)
-            
-            if not self.processing_thread or not self.processing_thread.is_alive():
-                self.stop_processing_event.clear()
-                self.processing_thread = threading.Thread(target=self._process_downloads)
-                self.processing_thread.daemon = True # Allow thread to exit with main app
-                self.processing_thread.start()
+        file_class = self.classifier.classify(file_path)
+        if file_class is FileClass.IGNORED:
+            self._cleanup_file_data(file_path)
+            return
+        if file_class is FileClass.TEMP:
+            self._cleanup_file_data(file_path)
+            self.notifier.update_status(f"Skipped temporary file: {os.path.basename(file_path)}")
+            self.notifier.log_message(f"Skipped temporary file: {os.path.basename(file_path)}", "info")
+            return
+
+        seed = self._scan_seeds.pop(file_path, None)
+        if previous_path in self.file_check_states:
+            # A tracked file was renamed: carry its entry over instead of starting again
+            self._rename_tracked_file(previous_path, file_path)
+            return
+        if file_path in self.file_check_states:
+            return # Already tracked; this event is merged into the existing entry
+
+        creation_time = self.file_creation_times.setdefault(file_path, time.time())
+        state = self.file_check_states[file_path] = FileCheckState(creation_time)
+        if seed:
+            # Found by the initial scan: the directory listing stands in for the first check
+            state.last_size, state.last_mtime = seed.st_size, seed.st_mtime
+        
+        # Try to detect expected file size
+        expected_size = self._detect_expected_file_size(file_path)
+        if expected_size:
+            self.file_expected_sizes[file_path] = expected_size
+            self.notifier.update_status(f"Detected file: {os.path.basename(file_path)} (Expected: {expected_size:,} bytes)")
+            self.notifier.log_message(f"File added with expected size: {os.path.basename(file_path)} -> {expected_size:,} bytes", "info")
         else:
-            self.app.update_status(f"Skipped temporary file: {os.path.basename(file_path)}")
-            self.app._log_message(f"Skipped temporary file: {os.path.basename(file_path)}", "info")
+            self.notifier.update_status(f"Detected file: {os.path.basename(file_path)} (Size unknown)")
+            self.notifier.log_message(f"File added without size info: {os.path.basename(file_path)}", "info")
+            self._resolve_size_from_url(file_path)
+            
+        self._journal_record(file_path)
+        self.download_queue.schedule(file_path)
+
+    def _rename_tracked_file(self, old_path, new_path):
+        """Moves the tracking entry of old_path to new_path and checks it right away."""
+        self.download_queue.discard(old_path)
+        self.file_check_states[new_path] = self.file_check_states.pop(old_path)
+        self.file_creation_times[new_path] = self.file_creation_times.pop(old_path, time.time())
+        if old_path in self.file_expected_sizes:
+            self.file_expected_sizes[new_path] = self.file_expected_sizes.pop(old_path)
+        self.file_last_writes.pop(old_path, None)
+        self.file_closed_times.pop(old_path, None)
+        if self.journal:
+            self.journal.remove(old_path)
+        self._journal_record(new_path)
+        self.notifier.log_message(f"Tracked file renamed: {os.path.basename(old_path)} -> {os.path.basename(new_path)}", "info")
+        self.download_queue.schedule(new_path)
+
+    def _enqueue_event(self, file_path, previous_path=None):
+        """
+        Hands a path from a watchdog observer thread to the enrichment stage.
+        Kept to a cheap enqueue so the observer never falls behind the OS event buffer.
+        Events for a path that is already tracked or already waiting in the queue
+        are coalesced into that entry.
+        """
+        if self.stop_processing_event.is_set():
+            return # Session is stopping; late observer or scan events are dropped
+        if os.path.normcase(file_path).startswith(self._app_data_prefix):
+            return # Journal writes in APP_DATA_DIR would otherwise be tracked as downloads
+        now = time.time()
+        with self._pending_events_lock:
+            if file_path in self._pending_events:
+                return
+            if previous_path is None and file_path in self.file_check_states:
+                return
+            self._pending_events[file_path] = now
+            self.file_creation_times.setdefault(file_path, now)
+        self.event_queue.put((file_path, now, previous_path))
+        self._ensure_processing_threads()
+
+    def _ensure_processing_threads(self):
+        """Starts the enrichment thread and completion worker pool on first use (events arrive on several observer threads)."""
+        with self._processing_threads_lock:
+            if self.stop_processing_event.is_set():
+                return # Never restart threads that stop_processing is shutting down
+            if not self.enrichment_thread or not self.enrichment_thread.is_alive():
+                self.enrichment_thread = threading.Thread(target=self._enrich_downloads, name="enrichment")
+                self.enrichment_thread.daemon = True # Allow thread to exit with main app
+                self.enrichment_thread.start()
+            for shard_index in range(self.download_queue.shard_count):
+                thread = self.processing_threads.get(shard_index)
+                if thread and thread.is_alive():
+                    continue
+                thread = threading.Thread(
+                    target=self._process_downloads,
+                    args=(shard_index,),
+                    name=f"completion-worker-{shard_index}",
+                )
+                thread.daemon = True # Allow thread to exit with main app
+                thread.start()
+                self.processing_threads[shard_index] = thread
+            if self.journal and (not self.journal_thread or not self.journal_thread.is_alive()):
+                self.journal_thread = threading.Thread(target=self._flush_journal, name="journal")
+                self.journal_thread.daemon = True # Allow thread to exit with main app
+                self.journal_thread.start()
+
+    def _enrich_downloads(self):
+        """
+        Enrichment stage: takes queued events, filters temporary files and detects
+        expected sizes (companion files, Telegram data), then hands each file to
+        the completion workers.
+        """
+        while not self.stop_processing_event.is_set():
+            item = self.event_queue.get()
+            if item is None:
+                break # Sentinel pushed by stop_processing
+            file_path, detected_at, previous_path = item
+
+            # Let the coalescing window pass so later events for this path fold into this entry.
+            # Items are FIFO, so these waits never add up beyond one window.
+            remaining = detected_at + EVENT_COALESCE_WINDOW - time.time()
+            if remaining > 0 and self.stop_processing_event.wait(remaining):
+                break
+            with self._pending_events_lock:
+                self._pending_events.pop(file_path, None)
+
+            try:
+                self._add_to_queue_if_not_temp(file_path, previous_path)
+            except Exception as e:
+                self.notifier.log_message(f"Error preparing {os.path.basename(file_path)} for tracking: {e}", "error")
 
     def on_created(self, event):
         """Called when a file or directory is created."""
         if not event.is_directory:
-            self._add_to_queue_if_not_temp(event.src_path)
+            self.companion_index.add(event.src_path)
+            self._enqueue_event(event.src_path)
 
     def on_moved(self, event):
         """
         Called when a file or directory is moved/renamed.
         This is crucial for detecting completed browser downloads.
         """
-        if not event.is_directory:
-            # When a file is moved/renamed, the destination path is the final, completed file.
-            self._add_to_queue_if_not_temp(event.dest_path)
+        if event.is_directory:
+            self.companion_index.forget_directory(event.src_path)
+            self.companion_index.forget_directory(event.dest_path)
+            return
+        self.companion_index.remove(event.src_path)
+        self.companion_index.add(event.dest_path)
+        # When a file is moved/renamed, the destination path is the final, completed file.
+        self._enqueue_event(event.dest_path, previous_path=event.src_path)
+        # Downloaders close the temporary file before renaming it, so the rename stands in for
+        # the close event; any later write to the destination cancels this.
+        self.file_closed_times[event.dest_path] = time.monotonic()
+        if event.dest_path in self.file_check_states:
+            # Renamed onto a file already tracked (e.g. Firefox's placeholder); check it like a close
+            self.download_queue.schedule(event.dest_path, CLOSE_GRACE_PERIOD)
+
+    def on_deleted(self, event):
+        """Called when a file or directory is deleted; keeps the companion index current."""
+        if event.is_directory:
+            self.companion_index.forget_directory(event.src_path)
+        else:
+            self.companion_index.remove(event.src_path)
 
-    def _process_downloads(self):
+    def on_modified(self, event):
         """
-        Processes files in the download queue to determine if they are complete.
-        This runs in a separate thread to avoid blocking the GUI.
-        Uses size-aware completion detection.
+        Called when a file is written to. Only records the write time of files that are
+        already tracked or queued, so edits to old files don't raise new notifications.
         """
-        while self.download_queue and not self.stop_processing_event.is_set():
-            file_path = self.download_queue.pop(0) # Get the first file in queue
-            
-            if not os.path.exists(file_path):
-                self.app._log_message(f"File disappeared before processing: {os.path.basename(file_path)}", "info")
-                self._cleanup_file_data(file_path)
-                continue
-                
-            self.app.update_status(f"Checking download status for: {os.path.basename(file_path)}")
-            if self._is_download_complete_size_aware(file_path):
-                self.app.notify_download_complete(file_path)
-                self._cleanup_file_data(file_path)
-            else:
-                # If not complete, put it back to re-check later
-                self.download_queue.append(file_path)
-                time.sleep(2) # Wait a bit before re-checking (longer for size-aware)
+        if not event.is_directory and (event.src_path in self.file_check_states or event.src_path in self._pending_events):
+            self.file_last_writes[event.src_path] = time.monotonic()
 
-    def _is_download_complete_size_aware(self, file_path):
+    def on_closed(self, event):
         """
-        Enhanced completion check using expected file size when available.
-        Falls back to stability-based detection if expected size is unknown.
+        Called when a writer closes a file (inotify close-after-write on Linux).
+        The file is checked once the grace period passes without another write,
+        which completes downloads from events instead of waiting on stability polling.
+        """
+        if event.is_directory:
+            return
+        self.close_events_supported = True
+        file_path = event.src_path
+        if file_path in self.file_check_states or file_path in self._pending_events:
+            self.file_closed_times[file_path] = time.monotonic()
+            if file_path in self.file_check_states:
+                self.download_queue.schedule(file_path, CLOSE_GRACE_PERIOD)
+
+    def _process_downloads(self, shard_index):
+        """
+        Processes files in one shard of the download queue to determine if they are complete.
+        This runs in a worker thread of the completion pool to avoid blocking the GUI.
+        Uses size-aware completion detection; each check is a single os.stat (or one shared
+        directory listing, see _stat_due_files) and never sleeps, so one worker can keep many
+        downloads moving.
+        """
+        while not self.stop_processing_event.is_set():
+            due_files = self.download_queue.next_due_batch(shard_index, self.stop_processing_event, STAT_SWEEP_BATCH_LIMIT)
+            if not due_files:
+                break # Stop was requested while waiting
+            # A close event or a HEAD answer may have rescheduled a file just before it finished
+            due_files = [file_path for file_path in due_files if file_path in self.file_check_states]
+
+            for file_path, stat_result in self._stat_due_files(due_files):
+                if isinstance(stat_result, FileNotFoundError):
+                    self.notifier.log_message(f"File disappeared before processing: {os.path.basename(file_path)}", "info")
+                    self._cleanup_file_data(file_path)
+                    continue
+                if isinstance(stat_result, OSError):
+                    self.notifier.log_message(f"Could not stat {os.path.basename(file_path)}: {stat_result}", "error")
+                    self.download_queue.schedule(file_path, RECHECK_INTERVAL)
+                    continue
+
+                self.notifier.update_status(f"Checking download status for: {os.path.basename(file_path)}")
+                if self._is_download_complete_size_aware(file_path, stat_result):
+                    state = self.file_check_states.get(file_path)
+                    if state and state.structure[1] is False:
+                        # Done by size or stability, but the format says otherwise; still announce it
+                        self.notifier.log_message(f"{os.path.basename(file_path)} may be truncated or damaged: "
+                                                  f"its {state.structure[0]} structure is incomplete", "error")
+                    self.notifier.notify_download_complete(file_path)
+                    self._cleanup_file_data(file_path)
+                else:
+                    # If not complete, give it its own deadline to be re-checked later
+                    self.download_queue.schedule(file_path, self._next_check_delay(file_path, stat_result))
+
+    def _stat_due_files(self, due_files):
+        """
+        Yields (file_path, os.stat_result or OSError) for each due file. A directory with at
+        least STAT_SWEEP_MIN_FILES due files is refreshed with one os.scandir sweep, reusing
+        the DirEntry stat results; other files get one os.stat each.
+        """
+        by_directory = collections.defaultdict(list)
+        for file_path in due_files:
+            by_directory[os.path.dirname(file_path)].append(file_path)
+        for directory, file_paths in by_directory.items():
+            if STAT_SWEEP_MIN_FILES and len(file_paths) >= STAT_SWEEP_MIN_FILES:
+                wanted = {os.path.basename(file_path): file_path for file_path in file_paths}
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            file_path = wanted.pop(entry.name, None)
+                            if file_path is None:
+                                continue
+                            try:
+                                yield file_path, entry.stat()
+                            except OSError as e:
+                                yield file_path, e
+                except OSError:
+                    pass # Listing failed; stat what is left one by one
+                # Not in the listing: usually gone, but confirm (e.g. a name differing only in case)
+                file_paths = list(wanted.values())
+            for file_path in file_paths:
+                try:
+                    yield file_path, os.stat(file_path)
+                except OSError as e:
+                    yield file_path, e
+
+    def _next_check_delay(self, file_path, stat_result):
+        """
+        Returns how long to wait before the next check of file_path.
+        A file that just reached its expected size is re-checked sooner to confirm it settled;
+        one that is still growing toward a known size is checked near its estimated finish.
         """
-        if not os.path.exists(file_path):
+        closed_time = self.file_closed_times.get(file_path)
+        if closed_time is not None and closed_time >= self.file_last_writes.get(file_path, 0):
+            remaining_grace = closed_time + CLOSE_GRACE_PERIOD - time.monotonic()
+            if remaining_grace > 0:
+                # Writer closed the file; check again as soon as the grace period is over
+                return remaining_grace
+            # Grace already over and the close path declined the file (empty, or not at its
+            # expected size): poll like any other file rather than rechecking at once forever
+        state = self.file_check_states.get(file_path)
+        expected_size = self.file_expected_sizes.get(file_path)
+        if (state and state.structure[1] and state.structure_checked == (stat_result.st_size, stat_result.st_mtime) and
+            (not expected_size or self._matches_expected_size(stat_result.st_size, expected_size))):
+            # Structurally whole; check again once the grace period since the last write is over
+            return max(MIN_CHECK_INTERVAL, stat_result.st_mtime + CLOSE_GRACE_PERIOD - time.time())
+        if expected_size and self._matches_expected_size(stat_result.st_size, expected_size):
+            return SIZE_CONFIRM_INTERVAL
+        if expected_size and state:
+            if state.stable_count:
+                # Stalled: back off, doubling with every check that saw no growth
+                return min(MAX_CHECK_INTERVAL, RECHECK_INTERVAL * 2 ** state.stable_count)
+            if state.rate and stat_result.st_size < expected_size:
+                # Halfway to the estimated finish, so the interval tightens as the file nears its size
+                eta = (expected_size - stat_result.st_size) / state.rate
+                return min(MAX_CHECK_INTERVAL, max(MIN_CHECK_INTERVAL, eta / 2))
+        if self.close_events_supported and not expected_size:
+            return FALLBACK_POLL_INTERVAL
+        return RECHECK_INTERVAL
+
+    def _is_closed_after_last_write(self, file_path):
+        """
+        True once the last writer closed file_path and no write arrived within CLOSE_GRACE_PERIOD.
+        """
+        closed_time = self.file_closed_times.get(file_path)
+        if closed_time is None or closed_time < self.file_last_writes.get(file_path, 0):
             return False
+        return time.monotonic() - closed_time >= CLOSE_GRACE_PERIOD
+
+    def _update_check_state(self, file_path, stat_result):
+        """
+        Records the latest size and modification time for file_path and
+        returns its FileCheckState with the consecutive-stable count updated,
+        or None if file_path is no longer tracked.
+        """
+        state = self.file_check_states.get(file_path)
+        if state is None:
+            return None
 
+        if stat_result.st_size == state.last_size and stat_result.st_mtime == state.last_mtime:
+            state.stable_count += 1
+        else:
+            state.stable_count = 0
+            state.record_size(stat_result.st_size, time.monotonic())
+            state.last_size = stat_result.st_size
+            state.last_mtime = stat_result.st_mtime
+            self._journal_record(file_path)
+        return state
+
+    def _check_file_structure(self, file_path, stat_result, state):
+        """Runs the format validator for file_path once per size/mtime; returns (format name, verdict)."""
+        if not FORMAT_VALIDATION_ENABLED:
+            return None, None
+        checked = (stat_result.st_size, stat_result.st_mtime)
+        if state.structure_checked != checked:
+            state.structure = check_file_structure(file_path, stat_result.st_size)
+            state.structure_checked = checked
+        return state.structure
+
+    def _journal_record(self, file_path):
+        """Queues the current tracking state of file_path for the next journal flush."""
+        state = self.file_check_states.get(file_path)
+        if self.journal and state:
+            self.journal.record(file_path, state.first_seen, self.file_expected_sizes.get(file_path),
+                                state.last_size, state.last_mtime)
+
+    def _flush_journal(self):
+        """Journal thread: writes buffered tracking updates every JOURNAL_FLUSH_INTERVAL seconds."""
+        import sqlite3
+        while not self.stop_processing_event.wait(JOURNAL_FLUSH_INTERVAL):
+            try:
+                self.journal.flush()
+            except (sqlite3.Error, OSError) as e:
+                self.notifier.log_message(f"Could not write tracking journal: {e}", "error")
+
+    def restore_tracked_files(self, roots):
+        """
+        Resumes tracking of the journaled files under roots. Each file is reconciled by the
+        completion worker's usual single os.stat: a file that is gone is dropped, and one whose
+        size and mtime still match the journal counts as a stable check, so a download that
+        finished while the app was not running completes right away instead of starting over.
+        Returns the number of files restored.
+        """
+        import sqlite3
         try:
-            current_size = os.path.getsize(file_path)
+            rows = self.journal.load() if self.journal else []
+        except (sqlite3.Error, OSError) as e:
+            self.notifier.log_message(f"Could not read tracking journal: {e}", "error")
+            return 0
+        roots = tuple(os.path.join(os.path.abspath(root), "") for root in roots)
+        restored = 0
+        for file_path, first_seen, expected_size, last_size, last_mtime in rows:
+            if os.path.normcase(file_path).startswith(self._app_data_prefix):
+                self.journal.remove(file_path) # Our own files, journaled by an earlier version
+                continue
+            if not file_path.startswith(roots):
+                # Not monitored in this session; kept for a later one unless the file is gone
+                if not os.path.lexists(file_path):
+                    self.journal.remove(file_path)
+                continue
+            if file_path in self.file_check_states:
+                continue
+            state = FileCheckState(first_seen)
+            state.last_size, state.last_mtime = last_size, last_mtime
+            self.file_creation_times[file_path] = first_seen
+            self.file_check_states[file_path] = state
+            if expected_size:
+                self.file_expected_sizes[file_path] = expected_size
+            self.download_queue.schedule(file_path)
+            restored += 1
+        if restored:
+            self.notifier.log_message(f"Resumed tracking of {restored} file(s) from the previous session", "info")
+            self._ensure_processing_threads()
+        return restored
+
+    def _matches_expected_size(self, current_size, expected_size):
+        """Allows a small tolerance for file system quirks or minor differences."""
+        tolerance = max(1024, expected_size * 0.001) # 1KB or 0.1%
+        return abs(current_size - expected_size) <= tolerance
+
+    def _is_download_complete_size_aware(self, file_path, stat_result):
+        """
+        Enhanced completion check using expected file size when available.
+        Falls back to stability-based detection if expected size is unknown.
+        """
+        try:
+            state = self._update_check_state(file_path, stat_result)
+            if state is None:
+                return False
+            current_size = stat_result.st_size
             expected_size = self.file_expected_sizes.get(file_path)
+            if expected_size and current_size > expected_size and not self._matches_expected_size(current_size, expected_size):
+                # Grown past the expected size, so that size was wrong; judge it as a file of unknown size
+                expected_size = None
+
+            # Structural path: the file's own end-of-file markers show it is whole. Written bytes
+            # must have settled for the grace period, in case the downloader fills the tail first.
+            # Without an expected size the file must also be unchanged since the previous check.
+            format_name, verdict = self._check_file_structure(file_path, stat_result, state)
+            if (verdict and time.time() - stat_result.st_mtime >= CLOSE_GRACE_PERIOD and
+                (self._matches_expected_size(current_size, expected_size) if expected_size else state.stable_count >= 1)):
+                self.notifier.log_message(f"{format_name} structure complete: {os.path.basename(file_path)}", "info")
+                return True
+
+            # Event-driven path: the writer closed the file and nothing was written since.
+            # A known expected size still has to match, since some downloaders reopen the file.
+            if (current_size > 0 and self._is_closed_after_last_write(file_path) and
+                (not expected_size or self._matches_expected_size(current_size, expected_size))):
+                self.notifier.log_message(f"Writer closed file: {os.path.basename(file_path)}", "info")
+                return True
             
             # If we know the expected size, use it for precise detection
             if expected_size:
-                # Allow a small tolerance for file system quirks or minor differences
-                # (e.g., 0.1% tolerance or a few bytes)
-                tolerance = max(1024, expected_size * 0.001) # 1KB or 0.1%
-                if abs(current_size - expected_size) <= tolerance:
-                    # Double-check that file is stable after reaching expected size
-                    # This helps ensure it's not still being written to.
-                    time.sleep(1)
-                    final_size = os.path.getsize(file_path)
-                    if abs(final_size - expected_size) <= tolerance:
+                if self._matches_expected_size(current_size, expected_size):
+                    # Require the size to be unchanged since the previous check after reaching
+                    # the expected size. This helps ensure it's not still being written to.
+                    if state.stable_count > 0:
                         progress_pct = (current_size / expected_size) * 100 if expected_size > 0 else 100
-                        self.app._log_message(f"Size match confirmed: {os.path.basename(file_path)} ({progress_pct:.1f}%)", "info")
+                        self.notifier.log_message(f"Size match confirmed: {os.path.basename(file_path)} ({progress_pct:.1f}%)", "info")
                         return True
+                    return False
                 else:
                     # Show progress if we know expected size
                     progress_pct = (current_size / expected_size) * 100 if expected_size > 0 else 0
-                    self.app.update_status(f"Downloading: {os.path.basename(file_path)} ({progress_pct:.1f}% - {current_size:,}/{expected_size:,} bytes)")
+                    speed = ""
+                    if state.stable_count:
+                        speed = ", stalled"
+                    elif state.rate and current_size < expected_size:
+                        eta = (expected_size - current_size) / state.rate
+                        speed = f", {format_file_size(int(state.rate))}/s, ETA {format_duration(eta)}"
+                    self.notifier.update_status(f"Downloading: {os.path.basename(file_path)} ({progress_pct:.1f}% - {current_size:,}/{expected_size:,} bytes{speed})")
                     return False
             
             # Fall back to stability-based detection if no expected size was found
-            return self._is_download_complete_stability(file_path)
+            return self._is_download_complete_stability(file_path, stat_result, state)
             
         except Exception as e:
-            self.app._log_message(f"Error in size-aware check for {os.path.basename(file_path)}: {e}", "error")
+            self.notifier.log_message(f"Error in size-aware check for {os.path.basename(file_path)}: {e}", "error")
             return False
 
-    def _is_download_complete_stability(self, file_path, check_interval=2, stable_checks=3):
+    def _is_download_complete_stability(self, file_path, stat_result, state, quiet_period=2, required_stable_checks=1):
         """
         Fallback stability-based completion detection.
-        Checks if file size and modification time remain stable over several intervals.
+        Passes once size and modification time have been unchanged for
+        required_stable_checks consecutive checks and the file has not been
+        modified for quiet_period seconds. Returns immediately; the caller
+        re-schedules the file instead of sleeping between checks.
         """
-        creation_time = self.file_creation_times.get(file_path, time.time())
-        time_since_creation = time.time() - creation_time
+        time_since_creation = time.time() - state.first_seen
         
         # For very new files, especially Telegram ones, give them a moment to start
         if self._is_likely_telegram_file(file_path) and time_since_creation < 5:
             return False
 
-        last_size = -1
-        last_modified = -1
-        
-        for i in range(stable_checks):
-            try:
-                current_size = os.path.getsize(file_path)
-                current_modified = os.path.getmtime(file_path)
-                
-                if (current_size == last_size and 
-                    current_modified == last_modified and 
-                    current_size > 0): # Ensure it's not a zero-byte file that never grew
-                    
-                    # Add a small buffer time after stability is detected to be extra sure
-                    time_since_modified = time.time() - current_modified
-                    if time_since_modified > 2: # File hasn't been modified for at least 2 seconds
-                        self.app._log_message(f"Stability check passed for: {os.path.basename(file_path)}", "info")
-                        return True
-                
-                last_size = current_size
-                last_modified = current_modified
-                time.sleep(check_interval)
-                
-            except FileNotFoundError:
-                # If file disappears during checks, it might have been moved/completed
-                # Consider it complete if it existed for at least one check (i.e., i > 0)
-                self.app._log_message(f"File disappeared during stability check: {os.path.basename(file_path)}", "info")
-                return i > 0
-            except Exception as e:
-                self.app._log_message(f"Error during stability check for {os.path.basename(file_path)}: {e}", "error")
-                return False
+        if (state.stable_count >= required_stable_checks and
+            stat_result.st_size > 0): # Ensure it's not a zero-byte file that never grew
+            
+            # Add a small buffer time after stability is detected to be extra sure
+            time_since_modified = time.time() - stat_result.st_mtime
+            if time_since_modified > quiet_period: # File hasn't been modified for at least quiet_period seconds
+                self.notifier.log_message(f"Stability check passed for: {os.path.basename(file_path)}", "info")
+                return True
 
-        self.app._log_message(f"Stability check failed after {stable_checks} attempts for: {os.path.basename(file_path)}", "info")
         return False
 
+    def scan_recent_files(self, roots, max_age_minutes, rules=None):
+        """
+        Starts a background scan of roots for files modified in the last max_age_minutes,
+        leaving out what rules (PathRules) exclude.
+        """
+        self.scan_thread = threading.Thread(target=self._scan_recent_files,
+                                            args=(roots, time.time() - max_age_minutes * 60, rules or PathRules(())),
+                                            name="initial-scan")
+        self.scan_thread.daemon = True # Allow thread to exit with main app
+        self.scan_thread.start()
+
+    def _scan_recent_files(self, roots, cutoff, rules):
+        """
+        Walks roots with os.scandir (iteratively, without following symlinks) and hands every
+        non-temporary file modified since cutoff to the enrichment stage as soon as it is found.
+        Names are classified before entry.stat(), which is free on Windows and the only stat on
+        other platforms, so temporary and ignored files are never stat'ed.
+        """
+        started = time.monotonic()
+        found = directories = 0
+        pending = [(directory, "") for directory in roots] # (folder, path relative to its root)
+        while pending and not self.stop_processing_event.is_set():
+            directory, relative = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    directories += 1
+                    for entry in entries:
+                        try:
+                            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                            if entry.is_dir(follow_symlinks=False):
+                                if not rules.excluded(entry_relative, True):
+                                    pending.append((entry.path, entry_relative))
+                                continue
+                            if not entry.is_file(follow_symlinks=False) or rules.excluded(entry_relative):
+                                continue
+                            if self.classifier.classify(entry.path) in (FileClass.TEMP, FileClass.IGNORED):
+                                continue
+                            stat_result = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue # Vanished or unreadable while scanning
+                        if stat_result.st_mtime >= cutoff and entry.path not in self.file_check_states:
+                            self._scan_seeds[entry.path] = stat_result
+                            self._enqueue_event(entry.path)
+                            found += 1
+            except OSError as e:
+                self.notifier.log_message(f"Initial scan skipped {directory}: {e}", "info")
+        self.notifier.log_message(
+            f"Initial scan found {found} recently modified file(s) in {directories} folder(s) "
+            f"({time.monotonic() - started:.1f} s)", "info")
+
     def _cleanup_file_data(self, file_path):
         """Cleans up tracking data for a file after it's processed."""
         self.file_creation_times.pop(file_path, None)
         self.file_expected_sizes.pop(file_path, None)
+        if self.file_check_states.pop(file_path, None) and self.journal:
+            self.journal.remove(file_path)
+        self.file_last_writes.pop(file_path, None)
+        self.file_closed_times.pop(file_path, None)
 
     def stop_processing(self):
-        """Signals the processing thread to stop and cleans up."""
-        self.stop_processing_event.set()
-        if self.processing_thread and self.processing_thread.is_alive():
-            # Give it a moment to finish current task, then join
-            self.processing_thread.join(timeout=5)
+        """Signals the enrichment thread and completion workers to stop and cleans up."""
+        with self._processing_threads_lock:
+            self.stop_processing_event.set() # No thread is started after this
+        # The scan feeds the other threads, so it is stopped first
+        if self.scan_thread and self.scan_thread.is_alive():
+            self.scan_thread.join(timeout=5)
+        self.event_queue.put(None) # Unblock the enrichment thread
+        self.download_queue.wake()
+        if self.enrichment_thread and self.enrichment_thread.is_alive():
+            self.enrichment_thread.join(timeout=5)
+        for thread in self.processing_threads.values():
+            # Give each worker a moment to finish its current check, then join
+            thread.join(timeout=5)
+        if self.journal_thread and self.journal_thread.is_alive():
+            self.journal_thread.join(timeout=5)
+        self.processing_threads.clear()
+        self.download_queue.clear()
         self.file_creation_times.clear()
         self.file_expected_sizes.clear()
+        self.file_check_states.clear()
+        self.file_last_writes.clear()
+        self.file_closed_times.clear()
+        self._scan_seeds.clear()
+        self.companion_index.clear()
+        if self.telegram_db:
+            self.telegram_db.close()
+        if self.browser_history:
+            self.browser_history.close()
+        self.url_sizes.close()
+        for line in self.size_providers.stats():
+            self.notifier.log_message(f"Size provider {line}", "info")
+        self.size_providers.shutdown()
+        if self.journal:
+            # In-memory state is cleared above; the journal keeps it for the next start
+            import sqlite3
+            try:
+                self.journal.close()
+            except (sqlite3.Error, OSError) as e:
+                self.notifier.log_message(f"Could not write tracking journal: {e}", "error")
+
+# --- Monitoring Session ---
+def _normalize_roots(paths, notifier):
+    """
+    Resolves paths to real directories and drops duplicates and roots nested inside another
+    root, since a recursive watch on the parent already covers them. Invalid paths are logged
+    and skipped. Returns the remaining roots, in the order given.
+    """
+    roots = {} # normcase'd real path -> real path
+    for path in paths:
+        if not os.path.isdir(path):
+            notifier.log_message(f"Warning: Invalid directory path skipped: {path}", "error")
+            continue
+        real_path = os.path.realpath(path)
+        roots.setdefault(os.path.normcase(real_path), real_path)
+    # Shorter keys first, so every parent is kept before the roots it contains are considered
+    kept_keys = []
+    for key in sorted(roots, key=len):
+        parent = next((k for k in kept_keys if key == k or key.startswith(os.path.join(k, ""))), None)
+        if parent is None:
+            kept_keys.append(key)
+        else:
+            notifier.log_message(f"Skipped {roots[key]}: already monitored as part of {roots[parent]}", "info")
+    return [root for key, root in roots.items() if key in kept_keys]
+
+def _inotify_watch_usage():
+    """
+    Returns (watches held by this process, fs.inotify.max_user_watches) on Linux, or None
+    where inotify is not available. The limit is shared by all processes of the user.
+    """
+    try:
+        with open("/proc/sys/fs/inotify/max_user_watches") as f:
+            limit = int(f.read())
+        in_use = 0
+        for fd in os.listdir("/proc/self/fd"):
+            try:
+                if os.readlink(f"/proc/self/fd/{fd}") != "anon_inode:inotify":
+                    continue
+                with open(f"/proc/self/fdinfo/{fd}") as f:
+                    in_use += sum(1 for line in f if line.startswith("inotify wd:"))
+            except OSError:
+                continue # fd closed meanwhile
+        return in_use, limit
+    except (OSError, ValueError):
+        return None
+
+class RuleFilteringHandler(FileSystemEventHandler):
+    """
+    Sits between the observer and the SizeAwareDownloadHandler and drops events for paths
+    that PathRules exclude (e.g. node_modules inside a folder that is watched whole).
+    Folders created below a shallow watch are handed to the monitor to be watched too.
+    """
+    def __init__(self, monitor, handler, roots, rules):
+        super().__init__()
+        self.monitor = monitor
+        self.handler = handler
+        self.rules = rules
+        self._root_prefixes = [(root, os.path.join(root, "")) for root in roots]
+
+    def _excluded(self, path, is_dir):
+        for root, prefix in self._root_prefixes:
+            if path == root:
+                return False
+            if path.startswith(prefix):
+                relative = path[len(prefix):]
+                if os.altsep:
+                    relative = relative.replace(os.sep, "/")
+                return self.rules.excluded(relative, is_dir)
+        return False # Not below a root we know of; let the handler decide
+
+    def dispatch(self, event):
+        paths = [event.src_path] + ([event.dest_path] if getattr(event, "dest_path", "") else [])
+        if all(self._excluded(path, event.is_directory) for path in paths):
+            return
+        if event.is_directory and event.event_type in ("created", "moved"):
+            self.monitor._watch_new_folder(paths[-1])
+        self.handler.dispatch(event)
+
+class DownloadMonitor:
+    """
+    Runs one monitoring session: a SizeAwareDownloadHandler plus the watchdog observer
+    feeding it. Shared by the GUI and headless mode; reports through a NotifierCore.
+    """
+    def __init__(self, notifier, worker_count=COMPLETION_WORKER_COUNT, scan_recent_minutes=INITIAL_SCAN_MINUTES,
+                 rules=None, size_provider_mode=SIZE_PROVIDER_MODE, disabled_size_providers=DISABLED_SIZE_PROVIDERS):
+        self.notifier = notifier
+        self.worker_count = worker_count
+        self.size_provider_mode = size_provider_mode
+        self.disabled_size_providers = disabled_size_providers
+        self.scan_recent_minutes = scan_recent_minutes # 0 skips the initial scan
+        self.rules = rules or PathRules() # Folders and files left out below each root
+        self.observer = None # One observer thread serves every monitored root
+        self.event_handler = None
+        self._dispatcher = None # RuleFilteringHandler in front of event_handler
+        self._roots = []
+        self._watch_count = 0
+        self._watch_lock = threading.Lock() # Watches are added by the setup thread and the observer thread
+        self._shallow_folders = set() # Folders watched without their subfolders
+        self._setup_thread = None # Plans and schedules the watches, off the caller's (e.g. Tk) thread
+        self._stopping = threading.Event()
+        self._watch_report_timer = None
+
+    @property
+    def is_running(self):
+        return self.event_handler is not None
+
+    def start(self, paths):
+        """
+        Starts watching each valid directory in paths (recursively) on a single observer.
+        Overlapping paths are merged first so no event is delivered twice.
+        Returns the paths that will be monitored; if empty, nothing was started. Their watches
+        are set up on a background thread, which logs any root that cannot be watched.
+        """
+        from watchdog.observers import Observer # Picks the platform backend; costly to import
+        self._roots = _normalize_roots(paths, self.notifier)
+        if not self._roots:
+            return []
+        # Use the new size-aware handler
+        journal = TrackingJournal(TRACKING_JOURNAL_FILE) if TRACKING_JOURNAL_FILE else None
+        size_providers = SizeProviderRegistry(self.size_provider_mode, self.disabled_size_providers)
+        self.event_handler = SizeAwareDownloadHandler(self.notifier, worker_count=self.worker_count, journal=journal,
+                                                      size_providers=size_providers)
+        self._dispatcher = RuleFilteringHandler(self, self.event_handler, self._roots, self.rules)
+        self._watch_count = 0
+        self._shallow_folders = set()
+        self._stopping = threading.Event()
+        self.observer = Observer()
+        self.observer.start() # Started first so each watch is set up (and can fail) on its own
+        self._setup_thread = threading.Thread(target=self._set_up_watches, args=(list(self._roots),), name="watch-setup")
+        self._setup_thread.daemon = True # Allow thread to exit with main app
+        self._setup_thread.start()
+        return list(self._roots)
+
+    def _set_up_watches(self, roots):
+        """
+        Runs on the setup thread: watches each root, which may walk large trees to leave out
+        ignored folders, then resumes tracking and starts the initial scan.
+        """
+        monitoring_successful_paths = []
+        for path_to_monitor in roots:
+            if self._stopping.is_set():
+                return
+            try:
+                self._schedule_watches(path_to_monitor, "")
+                monitoring_successful_paths.append(path_to_monitor)
+            except Exception as e:
+                self.notifier.log_message(f"Failed to start monitoring for {path_to_monitor}: {e}", "error")
+        if self._stopping.is_set():
+            return
+        if not monitoring_successful_paths:
+            self.notifier.log_message("Monitoring failed: none of the directories could be watched.", "error")
+            return
+        # Pick up downloads that were being tracked when the app last stopped or crashed
+        self.event_handler.restore_tracked_files(monitoring_successful_paths)
+        if self.scan_recent_minutes > 0:
+            # Runs alongside the observer, which is already delivering new events
+            self.event_handler.scan_recent_files(monitoring_successful_paths, self.scan_recent_minutes, self.rules)
+        # Recursive watches are added by the observer's emitter threads; report once they settle
+        self._watch_report_timer = threading.Timer(WATCH_REPORT_DELAY, self._report_watch_usage)
+        self._watch_report_timer.daemon = True
+        self._watch_report_timer.start()
+
+    def _plan_watches(self, folder, relative, budget):
+        """
+        Walks folder (skipping ignored subfolders) and returns (clean, watches): the
+        [(folder, recursive)] list that covers it without watching anything ignored,
+        and whether nothing below it was left out, so one recursive watch will do.
+        Only folders that are not clean are charged against budget, since a clean one
+        collapses into its parent's recursive watch. Returns None as soon as the list would
+        need more than budget watches, or when the monitor is stopping, instead of walking
+        the rest of the tree.
+        """
+        if self._stopping.is_set():
+            return None
+        if self.rules.max_depth is not None and (relative.count("/") + 1 if relative else 0) >= self.rules.max_depth:
+            return (False, [(folder, False)]) if budget >= 1 else None # Subfolders are past the depth limit
+        try:
+            with os.scandir(folder) as entries:
+                subfolders = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return True, [(folder, True)] # Unreadable here; let the watch itself report it
+        clean = True
+        watches = []
+        for entry in subfolders:
+            child = f"{relative}/{entry.name}" if relative else entry.name
+            if self.rules.excluded(child, True):
+                clean = False
+            else:
+                # Should the child not be clean, what it needs comes on top of this folder's own
+                # watch and its siblings'; a clean child never fails, whatever its budget
+                plan = self._plan_watches(entry.path, child, budget - len(watches) - 1)
+                if plan is None:
+                    return None
+                clean = clean and plan[0]
+                watches.extend(plan[1])
+            if not clean and len(watches) + 1 > budget:
+                return None
+        if clean:
+            return True, [(folder, True)]
+        return False, [(folder, False)] + watches
+
+    def _schedule_watches(self, folder, relative):
+        """Watches folder, leaving out ignored subfolders unless that takes too many watches."""
+        plan = self._plan_watches(folder, relative, MAX_PRUNED_WATCHES - self._watch_count) if self.rules.active \
+            else (True, [(folder, True)])
+        if self._stopping.is_set():
+            return
+        if plan is None:
+            self.notifier.log_message(f"Watching {folder} whole: leaving out its ignored folders would take more "
+                                      f"than the {MAX_PRUNED_WATCHES} watches allowed; their events are still filtered", "info")
+            watches = [(folder, True)]
+        else:
+            watches = plan[1]
+            if len(watches) > 1:
+                self.notifier.log_message(f"Watching {folder} with {len(watches)} watches to leave out ignored folders", "info")
+        with self._watch_lock:
+            for watch_folder, recursive in watches:
+                self.observer.schedule(self._dispatcher, watch_folder, recursive=recursive)
+                self._watch_count += 1
+                if not recursive:
+                    self._shallow_folders.add(watch_folder)
+
+    def _watch_new_folder(self, folder):
+        """
+        Called on the observer thread for each folder created or moved in. A folder whose
+        parent is watched recursively is already covered; below a shallow watch it needs its own.
+        """
+        parent = os.path.dirname(folder)
+        if parent not in self._shallow_folders:
+            return
+        root = next((root for root in self._roots if folder.startswith(os.path.join(root, ""))), None)
+        if root is None:
+            return
+        relative = folder[len(root) + 1:].replace(os.sep, "/")
+        if self.rules.excluded(relative, True):
+            return
+        try:
+            self._schedule_watches(folder, relative)
+        except Exception as e:
+            self.notifier.log_message(f"Failed to start monitoring for {folder}: {e}", "error")
+
+    def _report_watch_usage(self):
+        usage = _inotify_watch_usage()
+        if usage is None:
+            return
+        in_use, limit = usage
+        if in_use > limit * 0.8:
+            self.notifier.log_message(
+                f"inotify watches: {in_use:,} of {limit:,} allowed. Raise fs.inotify.max_user_watches "
+                "or monitor fewer folders, otherwise new subfolders may go unwatched.", "error")
+        else:
+            self.notifier.log_message(f"inotify watches: {in_use:,} of {limit:,} allowed", "info")
+
+    def stop(self):
+        self._stopping.set()
+        if self._setup_thread and self._setup_thread.is_alive():
+            self._setup_thread.join(timeout=5) # Stops between folders of its walk
+        self._setup_thread = None
+        if self._watch_report_timer:
+            self._watch_report_timer.cancel()
+            self._watch_report_timer = None
+        if self.observer:
+            self.observer.stop()
+            self.observer.join() # Wait for the observer thread to terminate
+            self.observer = None
+        self._dispatcher = None
+        self._shallow_folders = set()
+
+        if self.event_handler:
+            self.event_handler.stop_processing() # Stop the download processing threads
+            self.event_handler = None
+
+# --- Headless Mode ---
+class HeadlessNotifier(NotifierCore):
+    """
+    NotifierCore for servers without a display: writes one line per event to
+    stdout, a log file and/or a socket. Never imports tkinter or pygame.
+    """
+    def __init__(self, streams, verbose=False):
+        self.streams = streams # Text streams; a stream that fails is dropped
+        self.verbose = verbose # Also write status updates, which are frequent
+        self._lock = threading.Lock()
+
+    def _write(self, tag, message):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} [{tag}] {message}\n"
+        with self._lock:
+            for stream in list(self.streams):
+                try:
+                    stream.write(line)
+                    stream.flush()
+                except (OSError, ValueError):
+                    self.streams.remove(stream) # Peer closed the socket or file was closed
+
+    def log_message(self, message, tag=None):
+        self._write(tag or "info", message)
+
+    def update_status(self, message):
+        if self.verbose:
+            self._write("status", message)
+
+    def notify_download_complete(self, file_path):
+        try:
+            size_str = format_file_size(os.path.getsize(file_path))
+        except OSError:
+            size_str = "size unknown"
+        self._write("complete", f"{file_path} ({size_str})")
+
+    def close(self):
+        with self._lock:
+            for stream in self.streams:
+                if stream not in (sys.stdout, sys.stderr):
+                    stream.close()
+            self.streams = []
+
+def _open_socket_stream(address):
+    """Connects to "host:port" (TCP) or a Unix socket path and returns a writable text stream."""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        sock = socket.create_connection((host, int(port)))
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    return sock.makefile("w", encoding="utf-8")
+
+def run_headless(args):
+    """Monitors args.paths without a GUI until interrupted (Ctrl+C or SIGTERM)."""
+    streams = []
+    if not args.quiet and sys.stdout is not None: # sys.stdout is None in windowed builds
+        streams.append(sys.stdout)
+    if args.log_file:
+        streams.append(open(args.log_file, "a", encoding="utf-8"))
+    if args.socket:
+        streams.append(_open_socket_stream(args.socket))
+    if not streams:
+        print("No output available: pass --log-file or --socket.", file=sys.stderr)
+        return 2
+
+    notifier = HeadlessNotifier(streams, verbose=args.verbose)
+    rules = PathRules(WATCH_IGNORE_PATTERNS + tuple(args.exclude) + tuple(f"!{pattern}" for pattern in args.include),
+                      max_depth=args.max_depth)
+    monitor = DownloadMonitor(notifier, worker_count=args.workers, scan_recent_minutes=args.scan_recent, rules=rules,
+                              size_provider_mode=args.size_providers,
+                              disabled_size_providers=DISABLED_SIZE_PROVIDERS | set(args.disable_provider))
+    monitored = monitor.start(args.paths)
+    if not monitored:
+        notifier.log_message("Monitoring failed: No valid directories.", "error")
+        notifier.close()
+        return 1
+    notifier.log_message(f"Size-aware monitoring started for: {', '.join(monitored)}", "info")
+
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_requested.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+    while not stop_requested.wait(1): # Wake periodically so signals are handled promptly on Windows
+        pass
+
+    monitor.stop()
+    notifier.log_message("Monitoring stopped.", "info")
+    notifier.close()
+    return 0
+
+# --- Notification Aggregation ---
+class NotificationAggregator:
+    """
+    Collects completed downloads and releases them as one batch once `window` seconds
+    have passed since the first completion of the batch. Thread-safe.
+    """
+    def __init__(self, window=NOTIFICATION_WINDOW):
+        self.window = window
+        self._pending = [] # (file_path, file_size or None)
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def add(self, file_path, file_size):
+        with self._lock:
+            if not self._pending:
+                self._opened_at = time.monotonic()
+            self._pending.append((file_path, file_size))
+
+    def pop_ready(self):
+        """Returns the pending batch if its window has closed, otherwise None."""
+        with self._lock:
+            if not self._pending or time.monotonic() - self._opened_at < self.window:
+                return None
+            batch, self._pending = self._pending, []
+            return batch
+
+    @staticmethod
+    def summarize(batch, max_names=5):
+        """Returns (status line, notification text) for a batch, e.g. "12 downloads finished, 3.4 GB"."""
+        if len(batch) == 1:
+            file_path, file_size = batch[0]
+            download_name = os.path.basename(file_path)
+            if file_size is None:
+                return (f"Download Complete: {download_name}!",
+                        f"File '{download_name}' has finished downloading! (Size unknown)")
+            return (f"Download Complete: {download_name}!",
+                    f"File '{download_name}' has finished downloading!\n\nSize: {format_file_size(file_size)}")
+
+        total_size = sum(file_size for _, file_size in batch if file_size)
+        headline = f"{len(batch)} downloads finished, {format_file_size(total_size)}"
+        names = [os.path.basename(file_path) for file_path, _ in batch[:max_names]]
+        if len(batch) > max_names:
+            names.append(f"... and {len(batch) - max_names} more")
+        return headline, headline + "\n\n" + "\n".join(names)
 
 # --- Main Application Class ---
-class DownloadNotifierApp:
+class DownloadNotifierApp(NotifierCore):
     def __init__(self, master):
         self.master = master
         master.title("Download Notifier")
@@ -477,9 +2524,19 @@ class DownloadNotifierApp:
         master.resizable(False, False)
 
         self.monitor_path = tk.StringVar(value=DEFAULT_DOWNLOAD_DIR)
-        self.observers = [] # List to hold multiple Observer instances
-        self.event_handler = None
+        self.monitor = DownloadMonitor(self) # Observers and handler for the current session
         self.is_monitoring = False
+
+        # Log lines and the latest status from worker threads, drained by _drain_ui_updates
+        self._log_buffer = collections.deque(maxlen=LOG_BUFFER_SIZE)
+        self._dropped_log_lines = 0
+        self._pending_status = None
+        self._ui_updates_lock = threading.Lock()
+        self._drain_job = None
+        self.notification_aggregator = NotificationAggregator()
+        self.toast = None # Non-modal summary window, reused while it is open
+        self.toast_label = None
+        self._toast_close_job = None
         
         # Initialize Pygame mixer here as well, in case it wasn't done in __main__
         if not pygame.mixer.get_init():
@@ -487,6 +2544,9 @@ class DownloadNotifierApp:
                 pygame.mixer.init()
             except Exception as e:
                 print(f"Could not initialize Pygame mixer in app: {e}")
+        self.alarm_sounds = {} # sound file -> decoded pygame.mixer.Sound
+        self.alarm_channel = None # Channel reserved for alarms
+        self._alarm_end_job = None
 
         self._create_widgets()
         self._apply_theme(LIGHT_THEME) # Always apply light theme
@@ -496,6 +2556,27 @@ class DownloadNotifierApp:
         # Now, clicking 'X' will call on_closing, which stops monitoring and quits the app.
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        self._drain_job = self.master.after(LOG_FLUSH_INTERVAL_MS, self._drain_ui_updates)
+        self._preload_alarm_sounds()
+
+    def _preload_alarm_sounds(self):
+        """Decodes every configured alarm once and reserves a mixer channel to play them on."""
+        if not pygame.mixer.get_init():
+            return
+        pygame.mixer.set_reserved(1) # Channel 0 is only used when asked for explicitly
+        self.alarm_channel = pygame.mixer.Channel(0)
+        for sound_file in {ALARM_SOUND_FILE, *ALARM_SOUNDS_BY_EXTENSION.values()}:
+            try:
+                self.alarm_sounds[sound_file] = pygame.mixer.Sound(sound_file)
+            except (pygame.error, OSError) as e:
+                self.log_message(f"Could not load alarm sound '{sound_file}': {e}. Check that it exists and is a valid .wav or .mp3 file.", "error")
+
+    def _alarm_sound_for(self, batch):
+        """Picks the alarm for a batch from the file type of its first download."""
+        _, ext = os.path.splitext(batch[0][0])
+        sound_file = ALARM_SOUNDS_BY_EXTENSION.get(ext.lower(), ALARM_SOUND_FILE)
+        return self.alarm_sounds.get(sound_file) or self.alarm_sounds.get(ALARM_SOUND_FILE)
+
     def _center_window(self):
         """Centers the Tkinter window on the screen."""
         self.master.update_idletasks() # Update window to get accurate dimensions
@@ -695,31 +2776,14 @@ class DownloadNotifierApp:
             self.update_status("Already monitoring.")
             return
 
-        # Use the new size-aware handler
-        self.event_handler = SizeAwareDownloadHandler(self)
-        self.observers = [] # Reset list of observers
-        monitoring_successful_paths = []
-
-        for path_to_monitor in paths:
-            if not os.path.isdir(path_to_monitor):
-                self._log_message(f"Warning: Invalid directory path skipped: {path_to_monitor}", "error")
-                continue
-            try:
-                # Changed recursive to True to monitor subdirectories
-                observer = Observer()
-                observer.schedule(self.event_handler, path_to_monitor, recursive=True)
-                observer.start()
-                self.observers.append(observer)
-                monitoring_successful_paths.append(path_to_monitor)
-            except Exception as e:
-                self._log_message(f"Failed to start monitoring for {path_to_monitor}: {e}", "error")
+        monitoring_successful_paths = self.monitor.start(paths)
 
         if monitoring_successful_paths:
             self.is_monitoring = True
             self.start_button.config(state="disabled")
             self.stop_button.config(state="normal")
             self.update_status(f"Size-aware monitoring started for: {', '.join(monitoring_successful_paths)}")
-            self._log_message(f"Size-aware monitoring started for: {', '.join(monitoring_successful_paths)}", "info")
+            self.log_message(f"Size-aware monitoring started for: {', '.join(monitoring_successful_paths)}", "info")
         else:
             messagebox.showerror("Error", "No valid directories found to start monitoring.")
             self.update_status("Monitoring failed: No valid directories.")
@@ -730,108 +2794,165 @@ class DownloadNotifierApp:
             self.update_status("Not currently monitoring.")
             return
 
-        for observer in self.observers:
-            observer.stop()
-        for observer in self.observers:
-            observer.join() # Wait for all observer threads to terminate
-        self.observers = [] # Clear the list of observers
-
-        if self.event_handler:
-            self.event_handler.stop_processing() # Stop the download processing thread
-            self.event_handler = None
+        self.monitor.stop()
 
         self.is_monitoring = False
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
         self.update_status("Monitoring stopped.")
-        self._log_message("Monitoring stopped.", "info")
+        self.log_message("Monitoring stopped.", "info")
 
     def stop_alarm(self):
         """Stops the currently playing alarm sound."""
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.stop()
-            self.stop_alarm_button.config(state="disabled")
+        if self.alarm_channel and self.alarm_channel.get_busy():
+            self.alarm_channel.stop()
+            self._on_alarm_finished()
             self.update_status("Alarm stopped.")
-            self._log_message("Alarm manually stopped.", "info")
+            self.log_message("Alarm manually stopped.", "info")
         else:
             self.update_status("No alarm is currently playing.")
 
     def update_status(self, message):
-        """Updates the status label in the GUI."""
-        self.master.after(0, lambda: self.status_label.config(text=message))
-
-    def _log_message(self, message, tag=None):
-        """Adds a message to the log text area."""
-        self.master.after(0, lambda: self._insert_log_message(message, tag))
-
-    def _insert_log_message(self, message, tag):
+        """
+        Updates the status label in the GUI. Updates are coalesced: only the latest
+        one is shown on the next drain of the UI update loop.
+        """
+        with self._ui_updates_lock:
+            self._pending_status = message
+
+    def log_message(self, message, tag=None):
+        """Adds a message to the log text area on the next drain of the UI update loop."""
+        line = f"{time.strftime('%H:%M:%S')} - {message}\n"
+        with self._ui_updates_lock:
+            if len(self._log_buffer) == self._log_buffer.maxlen:
+                self._dropped_log_lines += 1 # Oldest line falls out of the ring buffer
+            self._log_buffer.append((line, tag or ()))
+
+    def _drain_ui_updates(self):
+        """
+        Runs on the Tk loop every LOG_FLUSH_INTERVAL_MS: inserts all buffered log lines
+        with one Text.insert, trims the widget to MAX_LOG_LINES, applies the latest status
+        and announces any batch of completions whose notification window has closed.
+        """
+        try:
+            with self._ui_updates_lock:
+                lines = list(self._log_buffer)
+                self._log_buffer.clear()
+                dropped, self._dropped_log_lines = self._dropped_log_lines, 0
+                status, self._pending_status = self._pending_status, None
+
+            if len(lines) > MAX_LOG_LINES:
+                # More than the widget keeps; don't insert lines that would be trimmed right away
+                keep = MAX_LOG_LINES - 1 # Leave room for the "skipped" notice
+                dropped += len(lines) - keep
+                lines = lines[-keep:]
+            if dropped:
+                lines.insert(0, (f"{time.strftime('%H:%M:%S')} - ... {dropped:,} older log lines skipped\n", "info"))
+            if lines:
+                self._insert_log_lines(lines)
+            if status is not None:
+                self.status_label.config(text=status)
+
+            batch = self.notification_aggregator.pop_ready()
+            if batch:
+                self._show_notification_and_play_sound(batch)
+        finally:
+            # Rescheduled even if a notification fails, so logging and status keep flowing
+            self._drain_job = self.master.after(LOG_FLUSH_INTERVAL_MS, self._drain_ui_updates)
+
+    def _insert_log_lines(self, lines):
+        chunks = [item for line_and_tag in lines for item in line_and_tag] # text, tag, text, tag...
         self.log_text.config(state="normal")
-        self.log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n", tag)
+        self.log_text.insert(tk.END, *chunks)
+        line_count = int(self.log_text.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{line_count - MAX_LOG_LINES}.0")
         self.log_text.see(tk.END) # Scroll to the end
         self.log_text.config(state="disabled")
 
     def notify_download_complete(self, file_path):
         """
-        Triggers the notification (sound and GUI update) when a download is complete.
-        This method is called from the DownloadHandler thread, so it uses master.after()
-        to safely update the GUI. Includes file size in notification.
+        Records a completed download. Called from the completion worker threads; the
+        alarm and summary are raised from the Tk loop once the notification window
+        closes, so completions arriving together produce one alert. Includes file size.
         """
         download_name = os.path.basename(file_path)
         try:
             file_size = os.path.getsize(file_path)
-            size_mb = file_size / (1024 * 1024)
-            
-            if size_mb >= 1: # Use MB for files 1MB or larger
-                size_str = f"{size_mb:.2f} MB"
-            elif file_size >= 1024: # Use KB for files 1KB or larger
-                size_kb = file_size / 1024
-                size_str = f"{size_kb:.2f} KB"
-            else: # Use bytes for smaller files
-                size_str = f"{file_size:,} bytes"
-                
-            status_msg = f"Download Complete: {download_name} ({size_str})"
-            notification_msg = f"File '{download_name}' has finished downloading!\n\nSize: {size_str}"
-            
+            self.log_message(f"Download Complete: {download_name} ({format_file_size(file_size)})", "download")
         except Exception as e:
-            status_msg = f"Download Complete: {download_name}"
-            notification_msg = f"File '{download_name}' has finished downloading! (Size unknown)"
-            self._log_message(f"Could not get file size for notification: {e}", "error")
-            
-        self.master.after(0, lambda: self._show_notification_and_play_sound(download_name, notification_msg))
-        self._log_message(status_msg, "download")
+            file_size = None
+            self.log_message(f"Could not get file size for notification: {e}", "error")
+            self.log_message(f"Download Complete: {download_name}", "download")
+        self.notification_aggregator.add(file_path, file_size)
 
-    def _play_alarm_sound(self):
-        """Plays the alarm sound using pygame.mixer.music."""
+    def _play_alarm_sound(self, sound):
+        """
+        Plays a preloaded alarm on the reserved channel (main thread). Instead of a thread
+        polling get_busy(), a Tk timer set to the sound's length marks the end of playback.
+        """
+        if sound is None or self.alarm_channel is None:
+            self.log_message(f"No alarm sound available. Check if '{ALARM_SOUND_FILE}' exists and is a valid audio file.", "error")
+            return
         try:
-            if not pygame.mixer.get_init():
-                pygame.mixer.init() # Ensure mixer is initialized in this thread if it wasn't already
-
-            pygame.mixer.music.load(ALARM_SOUND_FILE)
-            pygame.mixer.music.play()
-            self.master.after(0, lambda: self.stop_alarm_button.config(state="normal")) # Enable stop button
-            # Wait for sound to finish, then disable stop button
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-            self.master.after(0, lambda: self.stop_alarm_button.config(state="disabled")) # Disable stop button
+            self.alarm_channel.play(sound) # Restarts the alarm if one is still playing
         except pygame.error as e:
-            self._log_message(f"Error playing sound with Pygame in thread: {e}. Check if '{ALARM_SOUND_FILE}' exists and is a valid audio file.", "error")
-        except Exception as e:
-            self._log_message(f"An unexpected error occurred in sound thread: {e}", "error")
-
-    def _show_notification_and_play_sound(self, download_name, notification_msg=None):
-        """Helper to show notification and play sound on the main thread."""
-        if not notification_msg:
-            notification_msg = f"File '{download_name}' has finished downloading!"
-            
-        self.update_status(f"Download Complete: {download_name}!")
-
-        # Start a new thread to play the alarm sound
-        sound_thread = threading.Thread(target=self._play_alarm_sound)
-        sound_thread.daemon = True # Allow thread to exit with main app
-        sound_thread.start()
-
-        # Show the message box on the main thread (this will block until dismissed)
-        messagebox.showinfo("Download Complete", notification_msg)
+            self.log_message(f"Error playing sound with Pygame: {e}", "error")
+            return
+        self.stop_alarm_button.config(state="normal") # Enable stop button
+        if self._alarm_end_job:
+            self.master.after_cancel(self._alarm_end_job)
+        self._alarm_end_job = self.master.after(int(sound.get_length() * 1000) + 50, self._on_alarm_finished)
+
+    def _on_alarm_finished(self):
+        """Completion callback for the alarm: playback ended or was stopped."""
+        if self._alarm_end_job:
+            self.master.after_cancel(self._alarm_end_job)
+        self._alarm_end_job = None
+        self.stop_alarm_button.config(state="disabled") # Disable stop button
+
+    def _show_notification_and_play_sound(self, batch):
+        """Shows one summary for a batch of completions and plays the alarm once (main thread)."""
+        status_msg, notification_msg = NotificationAggregator.summarize(batch)
+        self.update_status(status_msg)
+        self._play_alarm_sound(self._alarm_sound_for(batch))
+        self._show_toast(notification_msg)
+
+    def _show_toast(self, message):
+        """
+        Shows message in a small non-modal window in the corner of the screen that closes
+        itself after TOAST_DURATION_MS. An open toast is updated rather than stacked.
+        """
+        if self.toast is None or not self.toast.winfo_exists():
+            self.toast = tk.Toplevel(self.master, padx=15, pady=10, bg=LIGHT_THEME["bg"])
+            self.toast.title("Download Complete")
+            self.toast.resizable(False, False)
+            self.toast.attributes("-topmost", True)
+            self.toast.protocol("WM_DELETE_WINDOW", self._close_toast)
+            self.toast_label = tk.Label(
+                self.toast, justify="left", wraplength=320, font=self.default_font,
+                bg=LIGHT_THEME["bg"], fg=LIGHT_THEME["fg"]
+            )
+            self.toast_label.pack(fill="x")
+            tk.Button(
+                self.toast, text="Dismiss", command=self._close_toast, font=self.default_font,
+                bg=LIGHT_THEME["browse_button_bg"], fg=LIGHT_THEME["browse_button_fg"], relief="raised", bd=2, padx=10
+            ).pack(anchor="e", pady=(10, 0))
+        elif self._toast_close_job:
+            self.toast.after_cancel(self._toast_close_job)
+
+        self.toast_label.config(text=message)
+        self.toast.update_idletasks()
+        x = self.toast.winfo_screenwidth() - self.toast.winfo_reqwidth() - 20
+        y = self.toast.winfo_screenheight() - self.toast.winfo_reqheight() - 80 # Stay clear of the taskbar
+        self.toast.geometry(f"+{x}+{y}")
+        self._toast_close_job = self.toast.after(TOAST_DURATION_MS, self._close_toast)
+
+    def _close_toast(self):
+        if self.toast is not None and self.toast.winfo_exists():
+            self.toast.destroy()
+        self.toast = None
+        self._toast_close_job = None
 
     def _show_about(self):
         """Displays an about message box."""
@@ -856,9 +2977,13 @@ class DownloadNotifierApp:
         """Handles graceful shutdown when the window is closed."""
         if self.is_monitoring:
             self.stop_monitoring()
-        # Ensure any playing music is stopped before quitting mixer
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.stop()
+        if self._drain_job:
+            self.master.after_cancel(self._drain_job)
+        # Ensure any playing alarm is stopped before quitting mixer
+        if self._alarm_end_job:
+            self.master.after_cancel(self._alarm_end_job)
+        if self.alarm_channel and self.alarm_channel.get_busy():
+            self.alarm_channel.stop()
         if pygame.mixer.get_init():
             pygame.mixer.quit()
         # If pygame was initialized, it's good practice to quit all modules
@@ -869,10 +2994,18 @@ class DownloadNotifierApp:
         self.master.destroy()
 
 # --- Main Execution ---
-if __name__ == "__main__":
-    # Initialize Pygame mixer (must be done before loading any sounds)
+def _load_gui_modules():
+    """Imports tkinter and pygame into the module globals used by DownloadNotifierApp."""
+    global tk, filedialog, messagebox, pygame
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    import pygame
+
+def run_gui():
+    _load_gui_modules()
+    # Initialize only the Pygame mixer (must be done before loading any sounds);
+    # pygame.init() would also start display, joystick and other unused subsystems
     try:
-        pygame.init()
         pygame.mixer.init()
     except Exception as e:
         print(f"Could not initialize Pygame mixer: {e}. Ensure necessary audio drivers are installed.")
@@ -894,4 +3027,38 @@ if __name__ == "__main__":
 
     root = tk.Tk()
     app = DownloadNotifierApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="download-notifier", description="Notifies you when downloads finish.")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without the GUI (no tkinter or pygame), reporting to stdout, a log file or a socket")
+    parser.add_argument("--path", dest="paths", action="append", metavar="DIR",
+                        help=f"directory to monitor in headless mode; repeat or comma-separate for several (default: {DEFAULT_DOWNLOAD_DIR})")
+    parser.add_argument("--log-file", metavar="FILE", help="append headless output to FILE")
+    parser.add_argument("--socket", metavar="HOST:PORT|PATH", help="send headless output to a TCP or Unix socket")
+    parser.add_argument("--quiet", action="store_true", help="do not write headless output to stdout")
+    parser.add_argument("--verbose", action="store_true", help="include status updates in headless output")
+    parser.add_argument("--workers", type=int, default=COMPLETION_WORKER_COUNT, help="number of completion workers")
+    parser.add_argument("--scan-recent", type=float, default=INITIAL_SCAN_MINUTES, metavar="MINUTES",
+                        help=f"on start, also track files modified in the last MINUTES (default: {INITIAL_SCAN_MINUTES or 'off'})")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN",
+                        help="gitignore-style pattern to leave out, e.g. 'build/' or '*.iso' (repeatable)")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="re-include paths an earlier pattern left out (repeatable)")
+    parser.add_argument("--max-depth", type=int, default=MAX_WATCH_DEPTH, metavar="N",
+                        help=f"watch at most N folder levels below each directory (default: {'no limit' if MAX_WATCH_DEPTH is None else MAX_WATCH_DEPTH})")
+    parser.add_argument("--size-providers", choices=("sequential", "concurrent"), default=SIZE_PROVIDER_MODE,
+                        help="ask expected-size providers one at a time or all at once (first answer wins)")
+    parser.add_argument("--disable-provider", action="append", default=[], metavar="NAME",
+                        help="turn off an expected-size provider: companion, telegram or browser (repeatable)")
+    args = parser.parse_args(argv)
+
+    if not args.headless:
+        run_gui()
+        return 0
+    args.paths = [p.strip() for value in (args.paths or [DEFAULT_DOWNLOAD_DIR]) for p in value.split(',') if p.strip()]
+    return run_headless(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,9 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# Build with DOWNLOAD_NOTIFIER_IMPORTTIME=1 to run the frozen app with "-X importtime",
+# for "python benchmarks.py startup --exe dist/download_notifier".
+options = [('X importtime', None, 'OPTION')] if os.environ.get('DOWNLOAD_NOTIFIER_IMPORTTIME') else []
 
 a = Analysis(
     ['download_notifier.py'],
@@ -19,6 +23,7 @@ pyz = PYZ(a.pure)
 exe = EXE(
     pyz,
     a.scripts,
+    options,
     a.binaries,
     a.datas,
     [],
@@ -0,0 +1,47 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download_notifier
+
+
+class RecordingNotifier(download_notifier.NotifierCore):
+    """NotifierCore that keeps everything it is told, for assertions."""
+    def __init__(self):
+        self.logs = []
+        self.statuses = []
+        self.completed = []
+        self._condition = threading.Condition()
+
+    def log_message(self, message, tag=None):
+        self.logs.append((tag, message))
+
+    def update_status(self, message):
+        self.statuses.append(message)
+
+    def notify_download_complete(self, file_path):
+        with self._condition:
+            self.completed.append(file_path)
+            self._condition.notify_all()
+
+    def wait_completed(self, count, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.completed) >= count, timeout)
+
+
+@pytest.fixture
+def notifier():
+    return RecordingNotifier()
+
+
+@pytest.fixture
+def handler(notifier):
+    handler = download_notifier.SizeAwareDownloadHandler(notifier, worker_count=2)
+    handler._browser_history_discovered = True # Keep the real browser profiles out of tests
+    handler._telegram_discovered = True
+    yield handler
+    handler.stop_processing()
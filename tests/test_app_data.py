@@ -0,0 +1,48 @@
+import os
+
+import download_notifier
+
+
+def _handler_with_app_data_in(monkeypatch, notifier, tmp_path):
+    app_data = tmp_path / ".download_notifier"
+    app_data.mkdir()
+    monkeypatch.setattr(download_notifier, "APP_DATA_DIR", str(app_data))
+    handler = download_notifier.SizeAwareDownloadHandler(notifier, worker_count=1)
+    handler._browser_history_discovered = True
+    handler._telegram_discovered = True
+    return handler, app_data
+
+
+def test_app_data_files_are_not_tracked(monkeypatch, notifier, tmp_path):
+    handler, app_data = _handler_with_app_data_in(monkeypatch, notifier, tmp_path)
+    try:
+        handler._enqueue_event(str(app_data / "tracking.db-wal"))
+        handler._enqueue_event(str(tmp_path / "movie.mkv"))
+        assert str(app_data / "tracking.db-wal") not in handler._pending_events
+        assert str(tmp_path / "movie.mkv") in handler._pending_events
+    finally:
+        handler.stop_processing()
+
+
+def test_app_data_is_excluded_even_when_the_rules_include_it(monkeypatch, notifier, tmp_path):
+    handler, app_data = _handler_with_app_data_in(monkeypatch, notifier, tmp_path)
+    try:
+        (app_data / "tracking.db").write_bytes(b"x")
+        (tmp_path / "movie.mkv").write_bytes(b"x")
+        rules = download_notifier.PathRules(patterns=()) # e.g. a custom WATCH_IGNORE_PATTERNS
+        handler._scan_recent_files([str(tmp_path)], 0, rules)
+        assert str(app_data / "tracking.db") not in handler._pending_events
+        assert str(tmp_path / "movie.mkv") in handler._pending_events
+    finally:
+        handler.stop_processing()
+
+
+def test_other_folders_of_the_same_name_are_watched(monkeypatch, notifier, tmp_path):
+    handler, _ = _handler_with_app_data_in(monkeypatch, notifier, tmp_path)
+    try:
+        elsewhere = tmp_path / "project" / ".download_notifier"
+        elsewhere.mkdir(parents=True)
+        handler._enqueue_event(os.path.join(elsewhere, "notes.pdf"))
+        assert os.path.join(elsewhere, "notes.pdf") in handler._pending_events
+    finally:
+        handler.stop_processing()
@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+import download_notifier
+
+
+def _chrome_history(path):
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE downloads (id INTEGER PRIMARY KEY, target_path TEXT, current_path TEXT, total_bytes INTEGER);
+        CREATE TABLE downloads_url_chains (id INTEGER, chain_index INTEGER, url TEXT, PRIMARY KEY (id, chain_index));
+    """)
+    return connection
+
+
+def _add_chrome_download(connection, rowid, target_path, total_bytes, *urls):
+    connection.execute("INSERT INTO downloads VALUES (?, ?, ?, ?)",
+                       (rowid, target_path, target_path + ".crdownload", total_bytes))
+    connection.executemany("INSERT INTO downloads_url_chains VALUES (?, ?, ?)",
+                           [(rowid, index, url) for index, url in enumerate(urls)])
+    connection.commit()
+
+
+def _firefox_places(path):
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE moz_places (id INTEGER PRIMARY KEY, url TEXT);
+        CREATE TABLE moz_anno_attributes (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE moz_annos (id INTEGER PRIMARY KEY, place_id INTEGER, anno_attribute_id INTEGER, content TEXT);
+        INSERT INTO moz_anno_attributes VALUES (1, 'downloads/destinationFileURI'), (2, 'downloads/metaData');
+    """)
+    return connection
+
+
+def _add_firefox_download(connection, place_id, url, target_path, file_size):
+    connection.execute("INSERT INTO moz_places VALUES (?, ?)", (place_id, url))
+    connection.execute("INSERT INTO moz_annos (place_id, anno_attribute_id, content) VALUES (?, 1, ?)",
+                       (place_id, Path(target_path).as_uri()))
+    connection.execute("INSERT INTO moz_annos (place_id, anno_attribute_id, content) VALUES (?, 2, ?)",
+                       (place_id, json.dumps({"state": 1, "fileSize": file_size})))
+    connection.commit()
+
+
+def test_chrome_size_and_final_url_of_redirect_chain(tmp_path):
+    history = tmp_path / "History"
+    connection = _chrome_history(history)
+    target = str(tmp_path / "Downloads" / "ubuntu.iso")
+    _add_chrome_download(connection, 1, target, 4_000_000_000,
+                         "https://example.com/get/ubuntu", "https://mirror.example.net/ubuntu.iso")
+    connection.close()
+
+    index = download_notifier.BrowserHistoryIndex([str(history)], refresh_interval=0)
+    try:
+        assert index.lookup(target) == 4_000_000_000
+        assert index.lookup(target + ".crdownload") == 4_000_000_000
+        assert index.url_for(target) == "https://mirror.example.net/ubuntu.iso"
+        assert index.lookup(str(tmp_path / "Downloads" / "other.iso")) is None
+    finally:
+        index.close()
+
+
+def test_chrome_rows_added_later_and_sizes_learned_later(tmp_path):
+    history = tmp_path / "History"
+    connection = _chrome_history(history)
+    connection.execute("PRAGMA journal_mode=WAL") # New rows stay in History-wal, as while Chrome runs
+    first = str(tmp_path / "first.zip")
+    second = str(tmp_path / "second.zip")
+    _add_chrome_download(connection, 1, first, 0, "https://example.com/first.zip") # No Content-Length yet
+
+    index = download_notifier.BrowserHistoryIndex([str(history)], refresh_interval=0)
+    try:
+        assert index.lookup(first) is None
+        assert index.url_for(first) == "https://example.com/first.zip"
+
+        connection.execute("UPDATE downloads SET total_bytes = 5000 WHERE id = 1")
+        _add_chrome_download(connection, 2, second, 7000, "https://example.com/second.zip")
+        assert os.path.exists(str(history) + "-wal")
+        assert index.lookup(first) == 5000
+        assert index.lookup(second) == 7000
+    finally:
+        index.close()
+        connection.close()
+
+
+def test_firefox_size_and_url_from_moz_annos(tmp_path):
+    places = tmp_path / "places.sqlite"
+    connection = _firefox_places(places)
+    target = str(tmp_path / "Downloads" / "video.mp4")
+    _add_firefox_download(connection, 7, "https://cdn.example.org/video.mp4", target, 123_456_789)
+    connection.close()
+
+    index = download_notifier.BrowserHistoryIndex([str(places)], refresh_interval=0)
+    try:
+        assert index.lookup(target) == 123_456_789
+        assert index.lookup(target + ".part") == 123_456_789
+        assert index.url_for(target) == "https://cdn.example.org/video.mp4"
+    finally:
+        index.close()
+
+
+def test_firefox_path_is_percent_decoded_once(tmp_path):
+    places = tmp_path / "places.sqlite"
+    connection = _firefox_places(places)
+    target = str(tmp_path / "Downloads" / "100%20final.pdf") # "%20" is part of the name
+    _add_firefox_download(connection, 7, "https://example.org/final.pdf", target, 2048)
+    connection.close()
+
+    index = download_notifier.BrowserHistoryIndex([str(places)], refresh_interval=0)
+    try:
+        assert index.lookup(target) == 2048
+        assert index.lookup(str(tmp_path / "Downloads" / "100 final.pdf")) is None
+    finally:
+        index.close()
+
+
+def test_unreadable_history_is_reported_and_skipped(tmp_path):
+    history = tmp_path / "History"
+    history.write_bytes(b"not a database")
+    errors = []
+
+    index = download_notifier.BrowserHistoryIndex([str(history)], refresh_interval=0,
+                                                  on_error=lambda path, error: errors.append(path))
+    try:
+        assert index.lookup(str(tmp_path / "file.zip")) is None
+        assert errors == [str(history)]
+    finally:
+        index.close()
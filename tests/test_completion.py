@@ -0,0 +1,176 @@
+import os
+import time
+
+import pytest
+
+import download_notifier
+
+
+def _closed_long_ago(handler, file_path):
+    handler.close_events_supported = True
+    handler.file_check_states[file_path] = download_notifier.FileCheckState(time.time())
+    handler.file_closed_times[file_path] = time.monotonic() - 10 * download_notifier.CLOSE_GRACE_PERIOD
+
+
+def test_declined_close_is_not_rechecked_immediately(handler, tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.touch()
+    _closed_long_ago(handler, str(empty))
+
+    stat_result = os.stat(empty)
+    assert not handler._is_download_complete_size_aware(str(empty), stat_result)
+    assert handler._next_check_delay(str(empty), stat_result) >= download_notifier.MIN_CHECK_INTERVAL
+
+
+def test_close_with_mismatched_expected_size_is_not_rechecked_immediately(handler, tmp_path):
+    partial = tmp_path / "partial.iso"
+    partial.write_bytes(b"x" * 100_000)
+    _closed_long_ago(handler, str(partial))
+    handler.file_expected_sizes[str(partial)] = 10_000_000
+
+    stat_result = os.stat(partial)
+    assert not handler._is_download_complete_size_aware(str(partial), stat_result)
+    assert handler._next_check_delay(str(partial), stat_result) >= download_notifier.MIN_CHECK_INTERVAL
+
+
+def test_close_within_grace_period_is_checked_when_it_ends(handler, tmp_path):
+    done = tmp_path / "done.bin"
+    done.write_bytes(b"x" * 100)
+    handler.file_check_states[str(done)] = download_notifier.FileCheckState(time.time())
+    handler.file_closed_times[str(done)] = time.monotonic()
+
+    delay = handler._next_check_delay(str(done), os.stat(done))
+    assert 0 < delay <= download_notifier.CLOSE_GRACE_PERIOD
+
+
+def test_empty_closed_file_does_not_spin_the_worker(handler, tmp_path):
+    empty = tmp_path / "empty.txt"
+    empty.touch()
+    checks = []
+    update_check_state = handler._update_check_state
+    handler._update_check_state = lambda path, stat_result: (checks.append(path), update_check_state(path, stat_result))[1]
+
+    _closed_long_ago(handler, str(empty))
+    handler.download_queue.schedule(str(empty))
+    handler._ensure_processing_threads()
+    time.sleep(1)
+
+    assert 1 <= len(checks) <= 3
+
+
+def test_rename_from_temporary_name_counts_as_close(handler, notifier, tmp_path):
+    from watchdog.events import FileMovedEvent
+
+    temporary = tmp_path / "movie.mkv.crdownload"
+    temporary.write_bytes(b"x" * 1000)
+    final = tmp_path / "movie.mkv"
+    os.rename(temporary, final)
+    handler.close_events_supported = True # Otherwise the 2 s stability poll would also finish it
+
+    started = time.monotonic()
+    handler.on_moved(FileMovedEvent(str(temporary), str(final)))
+
+    assert notifier.wait_completed(1, timeout=5)
+    assert notifier.completed == [str(final)]
+    # Coalescing window plus close grace, well before the fallback poll
+    assert time.monotonic() - started < download_notifier.FALLBACK_POLL_INTERVAL / 2
+
+
+def test_rename_onto_a_tracked_placeholder_is_checked_like_a_close(handler, notifier, tmp_path):
+    from watchdog.events import FileMovedEvent
+
+    # Firefox creates an empty placeholder under the final name, then renames the .part onto it
+    final = tmp_path / "report.pdf"
+    final.touch()
+    handler.close_events_supported = True
+    handler.file_check_states[str(final)] = download_notifier.FileCheckState(time.time())
+    handler.download_queue.schedule(str(final), download_notifier.FALLBACK_POLL_INTERVAL)
+    partial = tmp_path / "report.pdf.part"
+    partial.write_bytes(b"x" * 1000)
+    os.replace(partial, final)
+
+    handler.on_moved(FileMovedEvent(str(partial), str(final)))
+
+    assert notifier.wait_completed(1, timeout=download_notifier.FALLBACK_POLL_INTERVAL / 3)
+    assert notifier.completed == [str(final)]
+
+
+def test_file_rescheduled_after_it_finished_is_not_tracked_again(handler, notifier, tmp_path):
+    done = tmp_path / "done.bin"
+    done.write_bytes(b"x" * 100)
+    handler.download_queue.schedule(str(done)) # E.g. a late close event after cleanup
+    handler._ensure_processing_threads()
+
+    time.sleep(0.3)
+    assert str(done) not in handler.file_check_states
+    assert len(handler.download_queue) == 0
+    assert notifier.completed == []
+
+
+def test_events_after_stop_do_not_restart_processing(handler, tmp_path):
+    handler._enqueue_event(str(tmp_path / "first.bin"))
+    handler.stop_processing()
+
+    handler._enqueue_event(str(tmp_path / "late.bin")) # e.g. from the initial scan thread
+    assert handler.stop_processing_event.is_set()
+    assert str(tmp_path / "late.bin") not in handler._pending_events
+    assert not any(thread.is_alive() for thread in handler.processing_threads.values())
+
+
+def test_stop_during_initial_scan_leaves_no_threads_running(handler, tmp_path):
+    for index in range(200):
+        (tmp_path / f"file{index}.bin").write_bytes(b"x")
+    classify = handler.classifier.classify
+    def slow_classify(file_path):
+        time.sleep(0.001)
+        return classify(file_path)
+    handler.classifier.classify = slow_classify
+
+    handler.scan_recent_files([str(tmp_path)], 60)
+    deadline = time.monotonic() + 5
+    while handler.enrichment_thread is None and time.monotonic() < deadline:
+        time.sleep(0.01) # Let the scan queue a few files first
+    handler.stop_processing()
+
+    assert handler.stop_processing_event.is_set()
+    assert not handler.scan_thread.is_alive()
+    assert not handler.enrichment_thread.is_alive()
+    assert not any(thread.is_alive() for thread in handler.processing_threads.values())
+
+
+def _stat(size, mtime=None):
+    mtime = time.time() if mtime is None else mtime
+    return os.stat_result((0o100644, 0, 0, 1, 0, 0, size, mtime, mtime, mtime))
+
+
+def _growing(handler, file_path, expected_size, rate):
+    state = handler.file_check_states[file_path] = download_notifier.FileCheckState(time.time())
+    state.rate = rate
+    handler.file_expected_sizes[file_path] = expected_size
+    return state
+
+
+def test_interval_tightens_as_file_nears_its_expected_size(handler):
+    _growing(handler, "/downloads/big.iso", 1_000_000_000, rate=1_000_000) # 1 MB/s
+
+    delays = [handler._next_check_delay("/downloads/big.iso", _stat(size))
+              for size in (100_000_000, 900_000_000, 990_000_000, 998_000_000)]
+    assert delays[0] == download_notifier.MAX_CHECK_INTERVAL # 900 s left, capped
+    assert delays[1:] == pytest.approx([50, 5, 1]) # Halfway to each estimated finish
+
+    handler.file_check_states["/downloads/big.iso"].rate = 10_000_000_000 # Finishes in 10 ms
+    assert handler._next_check_delay("/downloads/big.iso", _stat(900_000_000)) == download_notifier.MIN_CHECK_INTERVAL
+
+
+def test_stall_backoff_doubles_up_to_the_maximum(handler):
+    state = _growing(handler, "/downloads/stuck.iso", 1_000_000_000, rate=1_000_000)
+
+    delays = []
+    for stable_count in range(1, 10):
+        state.stable_count = stable_count
+        delays.append(handler._next_check_delay("/downloads/stuck.iso", _stat(500_000_000)))
+    recheck = download_notifier.RECHECK_INTERVAL
+    assert delays[:3] == [recheck * 2, recheck * 4, recheck * 8]
+    assert all(later == min(2 * earlier, download_notifier.MAX_CHECK_INTERVAL)
+               for earlier, later in zip(delays, delays[1:]))
+    assert delays[-1] == download_notifier.MAX_CHECK_INTERVAL
@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import download_notifier
+
+
+def test_failed_flush_keeps_the_batch(monkeypatch, tmp_path):
+    journal = download_notifier.TrackingJournal(str(tmp_path / "tracking.db"))
+    journal.record("/downloads/a.bin", 1.0, None, 10, 2.0)
+    journal.flush()
+    journal.remove("/downloads/a.bin")
+    journal.record("/downloads/b.bin", 1.0, 500, 20, 2.0)
+
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+    connect = journal._connect
+    monkeypatch.setattr(journal, "_connect", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        journal.flush()
+    journal.record("/downloads/b.bin", 1.0, 500, 30, 3.0) # Newer than the failed batch
+
+    monkeypatch.setattr(journal, "_connect", connect)
+    journal.flush()
+    assert journal.load() == [("/downloads/b.bin", 1.0, 500, 30, 3.0)]
+    journal.close()
+
+
+def test_tracked_files_are_restored_after_a_restart(notifier, tmp_path):
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    finished = downloads / "finished.bin" # Completed while the app was not running
+    finished.write_bytes(b"x" * 1000)
+    old = time.time() - 60
+    os.utime(finished, (old, old))
+    deleted = downloads / "deleted.bin"
+    journal_path = str(tmp_path / "tracking.db")
+
+    journal = download_notifier.TrackingJournal(journal_path)
+    stat_result = os.stat(finished)
+    journal.record(str(finished), old, None, stat_result.st_size, stat_result.st_mtime)
+    journal.record(str(deleted), old, None, 500, old)
+    journal.close()
+
+    journal = download_notifier.TrackingJournal(journal_path)
+    handler = download_notifier.SizeAwareDownloadHandler(notifier, worker_count=2, journal=journal)
+    handler._browser_history_discovered = True
+    handler._telegram_discovered = True
+    try:
+        assert handler.restore_tracked_files([str(downloads)]) == 2
+        # Unchanged since the journal entry: completes on its first check
+        assert notifier.wait_completed(1, timeout=5)
+        assert notifier.completed == [str(finished)]
+        deadline = time.monotonic() + 5
+        while handler.file_check_states and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not handler.file_check_states
+    finally:
+        handler.stop_processing()
+    journal.close()
+    assert download_notifier.TrackingJournal(journal_path).load() == []
@@ -0,0 +1,28 @@
+import os
+import threading
+
+import download_notifier
+
+
+def test_files_of_one_folder_are_spread_over_every_worker(tmp_path):
+    queue = download_notifier.ShardedCompletionQueue(4)
+    paths = [os.path.join(tmp_path, f"part{index:03d}.bin") for index in range(100)]
+    for file_path in paths:
+        queue.schedule(file_path)
+
+    assert all(len(shard) for shard in queue._shards)
+    stop = threading.Event()
+    batches = [queue.next_due_batch(shard_index, stop, limit=1000) for shard_index in range(queue.shard_count)]
+    assert sorted(file_path for batch in batches for file_path in batch) == paths
+    assert len(queue) == 0
+
+
+def test_batch_only_takes_files_that_are_due(tmp_path):
+    scheduler = download_notifier.CompletionScheduler()
+    scheduler.schedule("now.bin")
+    scheduler.schedule("later.bin", 60)
+    scheduler.schedule("rescheduled.bin")
+    scheduler.schedule("rescheduled.bin", 60)
+
+    assert scheduler.next_due_batch(threading.Event(), limit=10) == ["now.bin"]
+    assert len(scheduler) == 2
@@ -0,0 +1,50 @@
+import threading
+
+import download_notifier
+
+
+def _blocking_provider(name, release, priority=10, timeout=0.05):
+    calls = []
+    def lookup(file_path):
+        calls.append(file_path)
+        release.wait(5)
+        return 1234
+    return download_notifier.SizeProvider(name, name, lookup, priority, timeout=timeout), calls
+
+
+def test_stalled_provider_is_skipped_until_its_call_returns():
+    release = threading.Event()
+    provider, calls = _blocking_provider("slow", release)
+    registry = download_notifier.SizeProviderRegistry("sequential", disabled=())
+    registry.register(provider)
+    try:
+        assert registry.detect("a.bin") == (None, None)
+        assert registry.detect("b.bin") == (None, None)
+        assert calls == ["a.bin"] # The second lookup would only have queued behind the first
+        assert provider.summary() == "slow: 1 timeouts, no call returned"
+
+        release.set()
+        registry._executor.submit(lambda: None).result(timeout=5) # Pool has drained
+        assert not provider.stalled
+        assert registry.detect("c.bin") == (1234, provider)
+    finally:
+        release.set()
+        registry.shutdown()
+
+
+def test_timeout_is_only_charged_to_calls_that_started():
+    release = threading.Event()
+    # Long enough for the pool to have started the first call, even on a busy machine
+    slow, _ = _blocking_provider("slow", release, priority=10, timeout=0.5)
+    queued, queued_calls = _blocking_provider("queued", release, priority=20, timeout=0.5)
+    registry = download_notifier.SizeProviderRegistry("concurrent", disabled=(), max_workers=1)
+    registry.register(slow)
+    registry.register(queued)
+    try:
+        assert registry.detect("a.bin") == (None, None)
+        assert slow.timeouts == 1
+        assert queued.timeouts == 0 and queued_calls == []
+        assert queued.summary() == "queued: not used"
+    finally:
+        release.set()
+        registry.shutdown()
@@ -0,0 +1,45 @@
+import os
+import time
+
+import download_notifier
+
+
+def _pdf(tmp_path, tail):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(b"%PDF-1.7\n" + b"1 0 obj\n<<>>\nendobj\n" * 20 + tail)
+    return str(path)
+
+
+def test_pdf_ending_in_eof_marker_is_whole(tmp_path):
+    path = _pdf(tmp_path, b"startxref\n123\n%%EOF\r\n")
+    assert download_notifier.check_file_structure(path, os.path.getsize(path)) == ("PDF", True)
+
+
+def test_pdf_with_a_revision_after_its_eof_marker_is_not_whole(tmp_path):
+    # First revision complete, incremental update still being written
+    path = _pdf(tmp_path, b"startxref\n123\n%%EOF\n2 0 obj\n<< /Type /Annot")
+    assert download_notifier.check_file_structure(path, os.path.getsize(path)) == ("PDF", False)
+
+
+def _track(handler, file_path):
+    handler.file_check_states[file_path] = download_notifier.FileCheckState(time.time())
+
+
+def test_structure_alone_needs_a_stable_check_when_size_is_unknown(handler, tmp_path):
+    path = _pdf(tmp_path, b"startxref\n123\n%%EOF\n")
+    _track(handler, path)
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    stat_result = os.stat(path)
+
+    assert not handler._is_download_complete_size_aware(path, stat_result) # First sighting
+    assert handler._is_download_complete_size_aware(path, stat_result)
+    assert any("PDF structure complete" in message for _, message in handler.notifier.logs)
+
+
+def test_structure_with_matching_expected_size_completes_at_once(handler, tmp_path):
+    path = _pdf(tmp_path, b"startxref\n123\n%%EOF\n")
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    handler.file_expected_sizes[path] = os.path.getsize(path)
+    _track(handler, path)
+
+    assert handler._is_download_complete_size_aware(path, os.stat(path))
@@ -0,0 +1,53 @@
+import sqlite3
+
+import download_notifier
+
+
+def _telegram_db(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE downloads (filename TEXT, size INTEGER)")
+    connection.executemany("INSERT INTO downloads VALUES (?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def test_lookup_prefers_exact_name_then_containing_name(tmp_path):
+    path = str(tmp_path / "data.db")
+    _telegram_db(path, [("video.mp4.backup", 10), ("video.mp4", 20), ("holiday video.mkv", 30)])
+    database = download_notifier.TelegramDatabase(path)
+    try:
+        assert database.lookup_size("video.mp4") == 20
+        assert database.lookup_size("video.mkv") == 30
+        assert database.lookup_size("other.zip") is None
+    finally:
+        database.close()
+
+
+def test_name_is_matched_literally(tmp_path):
+    path = str(tmp_path / "data.db")
+    _telegram_db(path, [("axb.mp4", 10), ("100%.zip", 20)])
+    database = download_notifier.TelegramDatabase(path)
+    try:
+        assert database.lookup_size("a_b.mp4") is None # No LIKE wildcards
+        assert database.lookup_size("100%.zip") == 20
+    finally:
+        database.close()
+
+
+def test_each_name_is_queried_once_until_the_database_changes(tmp_path):
+    path = str(tmp_path / "data.db")
+    _telegram_db(path, [("video.mp4", 20)])
+    database = download_notifier.TelegramDatabase(path, ttl=60)
+    statements = []
+    database._connect().set_trace_callback(statements.append)
+    try:
+        for _ in range(3):
+            assert database.lookup_size("video.mp4") == 20
+            assert database.lookup_size("missing.mp4") is None
+        assert len(statements) == 2
+
+        database._loaded_mtime = None # As after Telegram writes to the file
+        assert database.lookup_size("missing.mp4") is None
+        assert len(statements) == 3
+    finally:
+        database.close()
@@ -0,0 +1,129 @@
+import concurrent.futures
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import download_notifier
+
+
+class HeadHandler(http.server.BaseHTTPRequestHandler):
+    """HEAD-only stand-in for a download server; sizes and ETags come from server.files."""
+    protocol_version = "HTTP/1.1" # Keep-alive, like a real download host
+
+    def do_HEAD(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        time.sleep(self.server.delay)
+        size, etag = self.server.files[self.path]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+        else:
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(size))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), HeadHandler)
+    server.requests = []
+    server.delay = 0
+    server.files = {"/big.iso": (4_000_000_000, '"v1"'), "/page.html": (2_000, '"p1"')}
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def resolver():
+    resolver = download_notifier.UrlSizeResolver(threads=4, timeout=5)
+    yield resolver
+    resolver.close()
+
+
+def test_content_length_is_cached(server, resolver):
+    assert resolver.resolve(server.url + "/big.iso").result(timeout=5) == 4_000_000_000
+    assert resolver.resolve(server.url + "/big.iso").result(timeout=5) == 4_000_000_000
+    assert len(server.requests) == 1
+
+
+def test_expired_entry_is_revalidated_with_its_etag(server, resolver):
+    resolver.ttl = 0
+    assert resolver.resolve(server.url + "/big.iso").result(timeout=5) == 4_000_000_000
+    assert resolver.resolve(server.url + "/big.iso").result(timeout=5) == 4_000_000_000 # From a 304
+    assert server.requests == [("/big.iso", None), ("/big.iso", '"v1"')]
+
+
+def test_concurrent_lookups_share_one_request(server, resolver):
+    server.delay = 0.2
+    url = server.url + "/big.iso"
+    futures = [resolver.resolve(url) for _ in range(5)]
+    assert len({id(future) for future in futures}) == 1
+    assert [future.result(timeout=5) for future in futures] == [4_000_000_000] * 5
+    assert len(server.requests) == 1
+
+
+def _track(handler, file_path):
+    handler.file_check_states[file_path] = download_notifier.FileCheckState(time.time())
+
+
+def test_source_url_comes_from_explicit_keys_only(handler, tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"x")
+    (tmp_path / "video.mp4.info").write_text("Trailer, see https://example.com/about for details\n")
+    assert handler._find_source_url(str(video)) is None
+
+    (tmp_path / "video.mp4.json").write_text(json.dumps({"title": "x", "source_url": "https://cdn.example.com/video.mp4"}))
+    handler.companion_index = download_notifier.CompanionFileIndex()
+    assert handler._find_source_url(str(video)) == "https://cdn.example.com/video.mp4"
+
+
+def test_head_size_is_used_as_expected_size(server, handler, tmp_path):
+    download = tmp_path / "big.iso"
+    download.write_bytes(b"x" * 1000)
+    (tmp_path / "big.iso.json").write_text(json.dumps({"url": server.url + "/big.iso"}))
+    _track(handler, str(download))
+
+    handler._resolve_size_from_url(str(download))
+    handler.url_sizes.resolve(server.url + "/big.iso").result(timeout=5)
+    deadline = time.monotonic() + 5
+    while str(download) not in handler.file_expected_sizes and time.monotonic() < deadline:
+        time.sleep(0.01) # Callback runs on the resolver thread
+    assert handler.file_expected_sizes[str(download)] == 4_000_000_000
+
+
+def test_head_size_smaller_than_the_file_is_ignored(server, handler, tmp_path):
+    download = tmp_path / "big.iso"
+    download.write_bytes(b"x" * 100_000)
+    (tmp_path / "big.iso.json").write_text(json.dumps({"url": server.url + "/page.html"}))
+    _track(handler, str(download))
+
+    handler._resolve_size_from_url(str(download))
+    future = handler.url_sizes.resolve(server.url + "/page.html")
+    assert future.result(timeout=5) == 2_000
+    concurrent.futures.wait([future])
+    time.sleep(0.05) # Let the done callback finish
+    assert str(download) not in handler.file_expected_sizes
+
+
+def test_file_past_its_expected_size_falls_back_to_stability(handler, tmp_path):
+    download = tmp_path / "archive.bin"
+    download.write_bytes(b"x" * 100_000)
+    os.utime(download, (time.time() - 60, time.time() - 60))
+    handler.file_expected_sizes[str(download)] = 2_000
+    _track(handler, str(download))
+    stat_result = os.stat(download)
+
+    assert not handler._is_download_complete_size_aware(str(download), stat_result) # First sighting
+    assert handler._is_download_complete_size_aware(str(download), stat_result) # Unchanged since
@@ -0,0 +1,59 @@
+import os
+
+import download_notifier
+
+
+def _tree_with_ignored_folders(root, folders):
+    for index in range(folders):
+        os.makedirs(root / f"project{index}" / "node_modules")
+        os.makedirs(root / f"project{index}" / "src")
+
+
+def test_plan_leaves_out_ignored_folders(notifier, tmp_path):
+    _tree_with_ignored_folders(tmp_path, 3)
+    monitor = download_notifier.DownloadMonitor(notifier)
+
+    clean, watches = monitor._plan_watches(str(tmp_path), "", download_notifier.MAX_PRUNED_WATCHES)
+    assert not clean
+    assert (str(tmp_path), False) in watches
+    assert (str(tmp_path / "project0" / "src"), True) in watches
+    assert not any("node_modules" in folder for folder, _ in watches)
+
+
+def test_plan_stops_walking_once_over_budget(monkeypatch, notifier, tmp_path):
+    _tree_with_ignored_folders(tmp_path, 50)
+    monitor = download_notifier.DownloadMonitor(notifier)
+    scanned = []
+    scandir = os.scandir
+    def counting_scandir(path):
+        scanned.append(path)
+        return scandir(path)
+    monkeypatch.setattr(download_notifier.os, "scandir", counting_scandir)
+
+    assert monitor._plan_watches(str(tmp_path), "", 8) is None
+    assert len(scanned) < 20 # Not all 101 folders
+
+
+def test_watches_are_set_up_off_the_calling_thread(monkeypatch, notifier, tmp_path):
+    monkeypatch.setattr(download_notifier, "TRACKING_JOURNAL_FILE", None)
+    _tree_with_ignored_folders(tmp_path, 2)
+    monitor = download_notifier.DownloadMonitor(notifier)
+    try:
+        assert monitor.start([str(tmp_path)]) == [os.path.realpath(tmp_path)]
+        monitor._setup_thread.join(timeout=5)
+        assert monitor._watch_count == 1 + 2 * 2 # Root and each project shallow, each src recursive
+    finally:
+        monitor.stop()
+
+
+def test_clean_folders_do_not_count_against_the_budget(notifier, tmp_path):
+    for index in range(download_notifier.MAX_PRUNED_WATCHES + 8):
+        os.makedirs(tmp_path / "archive" / f"folder{index}")
+    monitor = download_notifier.DownloadMonitor(notifier)
+
+    assert monitor._plan_watches(str(tmp_path), "", download_notifier.MAX_PRUNED_WATCHES) == (True, [(str(tmp_path), True)])
+
+    os.makedirs(tmp_path / "node_modules")
+    clean, watches = monitor._plan_watches(str(tmp_path), "", download_notifier.MAX_PRUNED_WATCHES)
+    assert not clean
+    assert watches == [(str(tmp_path), False), (str(tmp_path / "archive"), True)]